@@ -0,0 +1,122 @@
+# Микробенчмарк выбора обработчика: прежний роутер с цепочкой F-фильтров против DispatchTable.
+# Запуск из корня репозитория: python -m bench.dispatch [-n 20000]
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from aiogram import Bot, F, Router, types
+from aiogram.filters import CommandStart
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from dispatch import DispatchTable
+from fsm import RequestState, ReminderState
+
+BUTTONS = [
+    "📝 Зарегистрироваться", "О боте", "⏱ Время", "Курс валют", "🔔 Напоминание",
+    "➕ Создать заявку", "📄 Мои заявки", "📋 Все заявки",
+]
+CALLBACKS = ["city", "rem_time", "rem_custom", "page", "cancel", "status"]
+
+
+async def noop(*args, **kwargs):
+    return True
+
+
+def legacy_router() -> Router:
+    # Тот же набор и порядок фильтров, что был в BotHandlers.__init__ до DispatchTable
+    router = Router()
+    router.message.register(noop, CommandStart())
+    router.message.register(noop, F.text == "📝 Зарегистрироваться")
+    router.message.register(noop, F.content_type == "contact")
+    router.message.register(noop, F.text == "О боте")
+    router.message.register(noop, F.text == "⏱ Время")
+    router.message.register(noop, F.text == "Курс валют")
+    router.message.register(noop, F.text == "🔔 Напоминание")
+    router.message.register(noop, F.content_type == "location")
+    router.callback_query.register(noop, F.data.startswith("city:"))
+    router.callback_query.register(noop, F.data.startswith("rem_time"))
+    router.callback_query.register(noop, F.data == "rem_custom")
+    router.callback_query.register(noop, F.data.startswith("page:"))
+    router.message.register(noop, ReminderState.entering_custom_time)
+    router.message.register(noop, ReminderState.entering_text)
+    router.message.register(noop, F.text == "➕ Создать заявку")
+    router.message.register(noop, RequestState.entering_text)
+    router.message.register(noop, F.text == "📄 Мои заявки")
+    router.callback_query.register(noop, F.data.startswith("cancel:"))
+    router.message.register(noop, F.text == "📋 Все заявки")
+    router.callback_query.register(noop, F.data.startswith("status:"))
+    return router
+
+
+def table_router() -> Router:
+    table = DispatchTable()
+    handlers = iter(range(100))
+
+    def handler():
+        # Отдельная функция на каждую запись, как у методов BotHandlers
+        async def target(event):
+            return True
+        target.__name__ = f"h{next(handlers)}"
+        return target
+
+    table.command("start", handler())
+    for text in BUTTONS:
+        table.text(text, handler())
+    table.content_type("contact", handler())
+    table.content_type("location", handler())
+    for state in (ReminderState.entering_custom_time, ReminderState.entering_text, RequestState.entering_text):
+        table.state(state, handler())
+    for prefix in CALLBACKS:
+        table.callback(prefix, handler())
+
+    async def dispatch_event(event, state, target):
+        return await table.call(target, event, state)
+
+    router = Router()
+    router.message.register(dispatch_event, table.match_message)
+    router.callback_query.register(dispatch_event, table.match_callback)
+    return router
+
+
+def sample_events():
+    chat = types.Chat(id=1, type="private")
+    user = types.User(id=1, is_bot=False, first_name="Bench")
+    now = datetime.now()
+    messages = [types.Message(message_id=1, date=now, chat=chat, from_user=user, text=text)
+                for text in ["/start", *BUTTONS, "какой-то текст"]]
+    callbacks = [types.CallbackQuery(id="1", from_user=user, chat_instance="1", data=f"{prefix}:1")
+                 for prefix in CALLBACKS]
+    return messages, callbacks
+
+
+async def measure(router: Router, messages, callbacks, iterations: int, data: dict) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for message in messages:
+            await router.message.trigger(message, **data)
+        for callback in callbacks:
+            await router.callback_query.trigger(callback, **data)
+    return (time.perf_counter() - started) / (iterations * (len(messages) + len(callbacks)))
+
+
+async def main(iterations: int):
+    messages, callbacks = sample_events()
+    bot = Bot(token="123456:bench")
+    # То же, что кладут в data Dispatcher и FSM-middleware (без состояния)
+    data = {
+        "bot": bot,
+        "state": FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=1, chat_id=1, user_id=1)),
+        "raw_state": None,
+    }
+    for name, router in (("router (F-фильтры)", legacy_router()), ("DispatchTable", table_router())):
+        per_event = await measure(router, messages, callbacks, iterations, data)
+        print(f"{name}: {per_event * 1e6:.1f} мкс на обновление")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations))
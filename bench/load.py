@@ -0,0 +1,301 @@
+# Нагрузочный бенчмарк: настоящий Dispatcher + BotHandlers против локального фейкового Bot API
+# и фейкового API курсов валют. Синтетические пользователи проходят регистрацию, создают заявки,
+# листают списки, ставят напоминания и смотрят курсы; админ листает все заявки и меняет статусы.
+# Листание идет по кнопке "Вперед" из последнего показанного списка, то есть с настоящим курсором.
+# Запуск из корня репозитория:
+#   python -m bench.load --users 50 --rounds 5 --concurrency 20 [--rate 500]
+#   python -m bench.load ... --save-baseline        # записать bench/baseline.json
+#   python -m bench.load ... --compare              # сравнить с baseline.json, код 1 при регрессии
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from aiohttp import web
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+ADMIN_ID = 1
+API_PORT = 18081
+
+
+# Начало текста списка заявок: по нему фейковый API запоминает кнопку "Вперед"
+LIST_HEADERS = ("📄 Твои заявки", "📋 Все заявки")
+NEXT_PAGE_TEXT = "➡️ Вперед"
+
+
+class FakeTelegramAPI:
+    # Отвечает на любой метод Bot API правдоподобным результатом
+    def __init__(self):
+        self.calls = {}
+        self.next_pages = {}  # chat_id -> callback_data кнопки "Вперед" последнего списка или None
+        self._message_ids = itertools.count(1)
+
+    def _remember_next_page(self, chat_id: int, form):
+        if not (form.get("text") or "").startswith(LIST_HEADERS):
+            return
+        markup = json.loads(form.get("reply_markup") or "{}")
+        self.next_pages[chat_id] = next(
+            (button["callback_data"] for row in markup.get("inline_keyboard", []) for button in row
+             if button.get("text") == NEXT_PAGE_TEXT),
+            None,
+        )
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] = self.calls.get(method, 0) + 1
+        form = await request.post()
+        if method == "getme":
+            result = {"id": 42, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method in ("sendmessage", "editmessagetext", "editmessagereplymarkup", "sendlocation", "senddocument"):
+            chat_id = int(form.get("chat_id") or 1)
+            self._remember_next_page(chat_id, form)
+            result = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": form.get("text") or "",
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def rates(self, request: web.Request) -> web.Response:
+        return web.json_response([{
+            "USD_in": "3.21", "USD_out": "3.25", "RUB_in": "3.50", "RUB_out": "3.60", "CNY_in": "4.40", "CNY_out": "4.50",
+        }])
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/rates", self.rates)
+        return app
+
+
+class UpdateFactory:
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+    def _message(self, user_id: int, **fields) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            **fields,
+        }
+
+    def text(self, user_id: int, text: str) -> dict:
+        return {"update_id": next(self._update_ids), "message": self._message(user_id, text=text)}
+
+    def contact(self, user_id: int) -> dict:
+        contact = {"phone_number": f"+375{user_id:09d}", "first_name": f"User{user_id}", "user_id": user_id}
+        return {"update_id": next(self._update_ids), "message": self._message(user_id, contact=contact)}
+
+    def callback(self, user_id: int, data: str) -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._message_ids)),
+                "from": self._user(user_id),
+                "chat_instance": "bench",
+                "data": data,
+                "message": {**self._message(42, text="..."), "chat": {"id": user_id, "type": "private"}},
+            },
+        }
+
+
+def next_page(fake: FakeTelegramAPI, factory: UpdateFactory, user_id: int):
+    # Шаг, который строится в момент отправки: нажатие "Вперед" из последнего списка пользователя
+    def build():
+        data = fake.next_pages.get(user_id)
+        return factory.callback(user_id, data) if data else None
+    return build
+
+
+def user_scenario(factory: UpdateFactory, fake: FakeTelegramAPI, user_id: int, rounds: int):
+    # Последовательность (сценарий, update) одного пользователя; порядок важен из-за FSM.
+    # Update может быть функцией без аргументов: она вызывается перед отправкой, None - шаг пропускается
+    yield "registration", factory.text(user_id, "/start")
+    yield "registration", factory.text(user_id, "📝 Зарегистрироваться")
+    yield "registration", factory.contact(user_id)
+    for n in range(rounds):
+        yield "request", factory.text(user_id, "➕ Создать заявку")
+        yield "request", factory.text(user_id, f"Заявка {n} от {user_id}")
+        yield "listing", factory.text(user_id, "📄 Мои заявки")
+        yield "listing", next_page(fake, factory, user_id)
+        yield "reminder", factory.text(user_id, "🔔 Напоминание")
+        yield "reminder", factory.callback(user_id, "rem_time:30")
+        yield "reminder", factory.text(user_id, f"Напоминание {n}")
+        yield "currency", factory.text(user_id, "Курс валют")
+        yield "currency", factory.callback(user_id, f"city:{random.choice(['Минск', 'Брест', 'Гомель'])}")
+
+
+def admin_scenario(factory: UpdateFactory, fake: FakeTelegramAPI, rounds: int, max_request_id: int):
+    yield "registration", factory.contact(ADMIN_ID)
+    for _ in range(rounds):
+        yield "admin_listing", factory.text(ADMIN_ID, "📋 Все заявки")
+        yield "admin_listing", next_page(fake, factory, ADMIN_ID)
+        request_id = random.randint(1, max_request_id)
+        yield "status", factory.callback(ADMIN_ID, f"status:{request_id}:{random.choice(['в работе', 'выполнена'])}")
+        yield "status", factory.callback(ADMIN_ID, f"bulk:{request_id},{request_id + 1},{request_id + 2}")
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run_bench(args) -> dict:
+    tmp = tempfile.mkdtemp(prefix="bot-bench-")
+    os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+    os.environ["URL"] = f"http://127.0.0.1:{API_PORT}/rates"
+    os.environ.setdefault("DB_GROUP_COMMIT_MS", str(args.group_commit_ms))
+
+    # Импорт после настройки окружения: run.py читает его при импорте
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import Update
+    import run
+    from handlers import BotHandlers
+    from database import Database
+    from metrics import metrics
+    from notifier import Notifier, TokenBucket
+
+    fake = FakeTelegramAPI()
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", API_PORT).start()
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{API_PORT}"))
+    bot = Bot(token="123456:bench", session=session)
+    BotHandlers.ADMINS = [ADMIN_ID]
+    # Лимиты Telegram в бенчмарке не нужны, иначе остановка ждет разбор очереди уведомлений
+    notifier = Notifier(bot, global_rate=1e6, chat_rate=1e6)
+    dp = run.create_dispatcher(bot, notifier=notifier)
+    await dp.emit_startup(bot=bot)
+
+    factory = UpdateFactory()
+    scenarios = [list(user_scenario(factory, fake, 1000 + i, args.rounds)) for i in range(args.users)]
+    max_request_id = args.users * (args.rounds + BotHandlers.REQUESTS_PER_PAGE)
+    admin_steps = list(admin_scenario(factory, fake, args.rounds * 2, max_request_id))
+    # Полная страница старых заявок у каждого пользователя, чтобы уже в первом раунде была вторая
+    # (создавать их сценарием не дает троттлинг save_request); в замеры не входит
+    for i in range(args.users):
+        for k in range(BotHandlers.REQUESTS_PER_PAGE):
+            await Database.add_request(user_id=1000 + i, text=f"Старая заявка {k} от {1000 + i}")
+
+    db_before = {name: h.count for name, h in metrics.histograms["bot_db_query_seconds"].items()}
+    bucket = TokenBucket(args.rate, max(1.0, args.rate / 10)) if args.rate else None
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = {}
+    errors = 0
+
+    async def play(steps):
+        nonlocal errors
+        for scenario, raw in steps:
+            if callable(raw):
+                raw = raw()
+                if raw is None:
+                    continue
+            if bucket:
+                await bucket.acquire()
+            update = Update.model_validate(raw, context={"bot": bot})
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await dp.feed_update(bot, update)
+                except Exception:
+                    errors += 1
+                latencies.setdefault(scenario, []).append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    # Регистрация админа до остальных, чтобы его заявки и статусы проходили проверку
+    await play(admin_steps[:1])
+    await asyncio.gather(*(play(steps) for steps in scenarios), play(admin_steps[1:]))
+    elapsed = time.perf_counter() - started
+
+    db_ops = {
+        name: h.count - db_before.get(name, 0)
+        for name, h in metrics.histograms["bot_db_query_seconds"].items()
+        if h.count - db_before.get(name, 0)
+    }
+    await dp.emit_shutdown(bot=bot)
+    await bot.session.close()
+    await runner.cleanup()
+
+    all_latencies = [v for values in latencies.values() for v in values]
+    return {
+        "updates": len(all_latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(all_latencies) / elapsed, 1),
+        "p50_ms": round(percentile(all_latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(all_latencies, 0.99) * 1000, 2),
+        "scenarios": {
+            name: {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 0.5) * 1000, 2),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            }
+            for name, values in sorted(latencies.items())
+        },
+        "db_ops": dict(sorted(db_ops.items())),
+        "api_calls": dict(sorted(fake.calls.items())),
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    if result["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"throughput {result['throughput']} < {baseline['throughput']}")
+    for key in ("p50_ms", "p99_ms"):
+        if result[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key} {result[key]} > {baseline[key]}")
+    for name, count in result["db_ops"].items():
+        if count > baseline["db_ops"].get(name, 0) * (1 + tolerance):
+            regressions.append(f"db_ops[{name}] {count} > {baseline['db_ops'].get(name, 0)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3, help="сколько раз каждый пользователь проходит сценарий")
+    parser.add_argument("--concurrency", type=int, default=20, help="обновлений в обработке одновременно")
+    parser.add_argument("--rate", type=float, default=0, help="обновлений в секунду, 0 - без ограничения")
+    parser.add_argument("--group-commit-ms", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение относительно baseline")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    result = asyncio.run(run_bench(args))
+    result["params"] = {k: getattr(args, k) for k in ("users", "rounds", "concurrency", "rate", "group_commit_ms")}
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    if args.save_baseline:
+        BASELINE_PATH.write_text(json.dumps(result, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        baseline = json.loads(BASELINE_PATH.read_text(encoding="utf-8"))
+        regressions = compare(result, baseline, args.tolerance)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ: {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    # LRU-кэш с ограничением по количеству записей и времени жизни, со счетчиками попаданий
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            return default
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def discard_where(self, predicate) -> int:
+        # Удаляет записи, для которых predicate(key, value) истинно
+        keys = [key for key, (value, _) in self._data.items() if predicate(key, value)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+
+class PageCache:
+    # Готовые страницы списков: (вид, владелец, курсор) -> (текст, разметка, id строк на странице).
+    # Владелец None - общий вид (все заявки). Инвалидация точечная:
+    # - строка изменилась на месте - сбрасываются только страницы, где она показана;
+    # - набор строк сдвинулся (добавление, удаление, отмена) - все страницы владельца и общего вида.
+    # generation защищает от гонки: страница, прочитанная из БД до инвалидации, в кэш не попадет
+    def __init__(self, maxsize: int = 2000, ttl: float = 300):
+        self._pages = TTLCache(maxsize, ttl)
+        self.generation = 0
+
+    def get(self, view: str, owner_id, cursor):
+        return self._pages.get((view, owner_id, cursor))
+
+    def set(self, view: str, owner_id, cursor, text: str, markup, item_ids, generation: int):
+        if generation == self.generation:
+            self._pages.set((view, owner_id, cursor), (text, markup, frozenset(item_ids)))
+
+    def invalidate(self, rows, shifted: bool):
+        # rows - [(id, владелец)] измененных строк, None - неизвестно какие (сбросить все)
+        self.generation += 1
+        if rows is None:
+            self._pages.clear()
+            return
+        if not shifted:
+            ids = {item_id for item_id, _ in rows}
+            found = set()
+
+            def shows(key, page):
+                hit = ids & page[2]
+                found.update(hit)
+                return bool(hit)
+
+            self._pages.discard_where(shows)
+            # Строки нет ни на одной закэшированной странице - возможно, она только что вернулась
+            # в список (например, из отмененных), поэтому дальше как при сдвиге
+            rows = [row for row in rows if row[0] not in found]
+            if not rows:
+                return
+        owners = {owner_id for _, owner_id in rows}
+        self._pages.discard_where(lambda key, page: key[1] is None or key[1] in owners)
+
+    def stats(self) -> dict:
+        return self._pages.stats()
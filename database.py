@@ -1,29 +1,81 @@
 import aiosqlite
+import asyncio
 import sqlite3
 import os
-from dotenv import load_dotenv
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
 from typing import Optional
-
-load_dotenv()
-DB_PATH = os.getenv("DB_PATH") or "bot.db"
+from migrations import MIGRATIONS, LATEST_VERSION
+from cache import TTLCache
 
 
 class Database:
     _conn: Optional[aiosqlite.Connection] = None
+    # Group commit: записи копятся в очереди и коммитятся одной транзакцией
+    _write_queue: Optional[asyncio.Queue] = None
+    _write_task: Optional[asyncio.Task] = None
+    _group_commit_interval: float = 0.0
+    _group_commit_max: int = 100
+    # Без group commit записи идут напрямую; лок не дает одной из них закоммитить чужой
+    # недовыполненный оператор (например, UPDATE ... RETURNING, строки которого еще читаются)
+    _write_lock: Optional[asyncio.Lock] = None
+    # Пул read-only соединений для чтения, _conn остается единственным писателем
+    _read_pool: Optional[asyncio.Queue] = None
+    _read_conns: list = []
+    # Кэш is_registered: только зарегистрированные user_id, add_user добавляет их сразу после записи.
+    # Отрицательные ответы не кэшируются: регистрация могла пройти на другом воркере
+    _registered = TTLCache(maxsize=100_000, ttl=3600)
+    # Подписчики на изменения заявок (кэш готовых страниц): listener(rows, shifted), где
+    # rows - [(id, user_id)] или None, если неизвестно какие; shifted - строки добавились или пропали из списков
+    _requests_listeners: list = []
+    # Поиск: минимальная длина префиксного терма и сколько новейших совпадений ранжировать
+    FTS_MIN_PREFIX = 3
+    FTS_RANK_CANDIDATES = 1000
 
     @classmethod
-    async def init(cls, db_path: Optional[str] = None):
-        db_path = db_path or DB_PATH
-        if not db_path:
-            raise RuntimeError("DB_PATH не задан. Проверь .env")
+    async def init(cls, db_path: Optional[str] = None, group_commit_ms: Optional[int] = None,
+                   group_commit_max: int = 100, read_pool_size: int = 0,
+                   registration_cache_size: int = 100_000, registration_cache_ttl: float = 3600):
+        # .env читает run.py, повторно load_dotenv здесь не нужен
+        db_path = db_path or os.getenv("DB_PATH") or "bot.db"
+        cls._registered = TTLCache(maxsize=registration_cache_size, ttl=registration_cache_ttl)
         cls._conn = await aiosqlite.connect(db_path)
+        cls._write_lock = asyncio.Lock()
         cls._conn.row_factory = sqlite3.Row
+        # Действует только для новой БД (до первой таблицы); существующей нужен разовый VACUUM
+        await cls._conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
         await cls._conn.execute("PRAGMA journal_mode=WAL;")
         await cls._conn.execute("PRAGMA foreign_keys = ON;")
         await cls._conn.commit()
+        if group_commit_ms:
+            cls._group_commit_interval = group_commit_ms / 1000
+            cls._group_commit_max = group_commit_max
+            cls._write_queue = asyncio.Queue()
+            cls._write_task = asyncio.create_task(cls._group_commit_loop())
+        if read_pool_size > 0:
+            # Файл и WAL уже созданы писателем, читатели открываются только на чтение
+            uri = Path(db_path).absolute().as_uri() + "?mode=ro"
+            cls._read_pool = asyncio.Queue()
+            for _ in range(read_pool_size):
+                conn = await aiosqlite.connect(uri, uri=True)
+                conn.row_factory = sqlite3.Row
+                await conn.execute("PRAGMA query_only = ON;")
+                cls._read_conns.append(conn)
+                cls._read_pool.put_nowait(conn)
 
     @classmethod
     async def close(cls):
+        if cls._write_task:
+            # None - сигнал воркеру дописать то, что осталось в очереди, и завершиться
+            await cls._write_queue.put(None)
+            await cls._write_task
+            cls._write_task = None
+            cls._write_queue = None
+        for conn in cls._read_conns:
+            await conn.close()
+        cls._read_conns = []
+        cls._read_pool = None
         if cls._conn:
             await cls._conn.close()
             cls._conn = None
@@ -32,119 +84,543 @@ class Database:
     async def init_db(cls):
         if cls._conn is None:
             raise RuntimeError("DB не инициализирована. Вызови Database.init() первым.")
-        await cls._conn.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                first_name TEXT,
-                last_name TEXT,
-                phone_number TEXT
-            )
-        """)
-        await cls._conn.execute("""
-            CREATE TABLE IF NOT EXISTS requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                text TEXT,
-                status TEXT DEFAULT 'новая',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        await cls._conn.commit()
+        cur = await cls._conn.execute("PRAGMA user_version")
+        current = (await cur.fetchone())[0]
+        await cur.close()
+        if current >= LATEST_VERSION:
+            # Обычный рестарт: схема актуальна, DDL не выполняется
+            return
+        for version, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            # Каждая миграция - отдельная короткая транзакция, чтобы не держать блокировку записи
+            await cls._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Миграцию мог уже применить другой процесс, пока мы ждали блокировку
+                cur = await cls._conn.execute("PRAGMA user_version")
+                current = (await cur.fetchone())[0]
+                await cur.close()
+                if version <= current:
+                    await cls._conn.rollback()
+                    continue
+                for sql in statements:
+                    await cls._conn.execute(sql)
+                await cls._conn.execute(f"PRAGMA user_version = {version}")
+                await cls._conn.commit()
+            except Exception:
+                await cls._conn.rollback()
+                raise
+            logging.info("Миграция БД %s применена", version)
 
-    # ---------------- USERS ----------------
     @classmethod
-    async def add_user(cls, user_id: int, first_name: str, last_name: str, phone_number: str):
+    async def check_query_plans(cls):
+        # Прогоняет EXPLAIN QUERY PLAN по всем запросам Database и падает, если какой-то из них
+        # делает SCAN (в том числе полный обход индекса) или сортирует во временном B-tree.
+        # Намеренные SCAN (обход, который останавливается на LIMIT) перечислены отдельно в bounded_scans,
+        # ограниченные сортировки - в bounded_sorts
         if cls._conn is None:
             raise RuntimeError("DB not initialized")
-        cur = await cls._conn.execute(
-            "INSERT OR REPLACE INTO users (user_id, first_name, last_name, phone_number) VALUES (?, ?, ?, ?)",
-            (user_id, first_name, last_name, phone_number)
+        queries = [
+            ("SELECT 1 FROM users WHERE user_id = ?", (1,)),
+            ("UPDATE requests SET status=? WHERE id=? RETURNING id, user_id", ("новая", 1)),
+            ("DELETE FROM requests WHERE id=? RETURNING id, user_id", (1,)),
+            (cls._bulk_status_by_ids_sql(2), ("выполнена", 1, 2, "выполнена")),
+            (cls._bulk_status_older_sql(), ("выполнена", "-1 days", "выполнена")),
+            (cls._claim_reminders_sql(), (0, 1)),
+            ("SELECT MIN(due_at) FROM reminders WHERE status = 'pending'", ()),
+            ("UPDATE reminders SET status = ?, delivered_at = ? WHERE id = ?", ("sent", 0, 1)),
+            ("SELECT state, data FROM fsm_storage WHERE key = ? AND expires_at > ?", ("", 0)),
+            (cls._archive_copy_sql(), ("", 1)),
+            (cls._archive_delete_sql(), ("", 1)),
+            cls._archived_requests_query(1, 1),
+            ("DELETE FROM fsm_storage WHERE expires_at <= ?", (0,)),
+        ]
+        for user_id in (None, 1):
+            for after, before in ((None, None), (("", 1), None), (None, ("", 1))):
+                if user_id is None and after is None and before is None:
+                    continue
+                sql, params = cls._requests_page_query(user_id, after, before, 3, True)
+                queries.append((sql, params))
+        bounded_scans = [
+            # Первая страница всех заявок и последние из архива: обход индекса в нужном порядке,
+            # который останавливается на LIMIT
+            cls._requests_page_query(None, None, None, 3, True),
+            cls._archived_requests_query(None, 1),
+            # Обход частичного индекса, в котором только захваченные напоминания
+            ("UPDATE reminders SET status = 'pending' WHERE status = 'sending'", ()),
+            # Прогрев кэша регистраций: первые maxsize пользователей, раз за запуск
+            (cls._preload_registered_sql(), (1,)),
+        ]
+        # Поиск: FTS5 показывает обход своего индекса как SCAN виртуальной таблицы, а ранжирование
+        # обходит и сортирует не больше FTS_RANK_CANDIDATES строк подзапроса candidates
+        bounded_sorts = [
+            (cls._search_requests_sql(False), ('"a"*', 1, 1)),
+            (cls._search_requests_sql(True), ('"a"*', 1, "новая", 1)),
+        ]
+        checks = (
+            [(*q, False, False) for q in queries]
+            + [(*q, True, False) for q in bounded_scans]
+            + [(*q, True, True) for q in bounded_sorts]
         )
-        await cls._conn.commit()
-        await cur.close()
+        problems = []
+        for sql, params, scan_ok, sort_ok in checks:
+            cur = await cls._conn.execute("EXPLAIN QUERY PLAN " + sql, params)
+            rows = await cur.fetchall()
+            await cur.close()
+            for row in rows:
+                detail = row[3]
+                full_scan = detail.startswith("SCAN ") and not scan_ok
+                if full_scan or ("TEMP B-TREE" in detail and not sort_ok):
+                    problems.append(f"{' '.join(sql.split())}: {detail}")
+        if problems:
+            raise RuntimeError("Запросы без индекса:\n" + "\n".join(problems))
 
     @classmethod
-    async def is_registered(cls, user_id: int) -> bool:
+    @asynccontextmanager
+    async def _reader(cls):
+        # Соединение для чтения из пула, без пула - общее соединение писателя
+        if cls._conn is None:
+            raise RuntimeError("DB not initialized")
+        if cls._read_pool is None:
+            yield cls._conn
+            return
+        conn = await cls._read_pool.get()
+        try:
+            yield conn
+        finally:
+            cls._read_pool.put_nowait(conn)
+
+    # ---------------- WRITES ----------------
+    @classmethod
+    async def _write(cls, sql: str, params, many: bool = False, fetch: bool = False):
+        # Возвращает (lastrowid, rowcount) уже после коммита, в обоих режимах.
+        # many=True - executemany по списку наборов параметров,
+        # fetch=True - вместо (lastrowid, rowcount) строки из RETURNING
         if cls._conn is None:
             raise RuntimeError("DB not initialized")
-        cur = await cls._conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,))
-        row = await cur.fetchone()
+        if cls._write_queue is None:
+            async with cls._write_lock:
+                result = await cls._execute_write(sql, params, many, fetch)
+                await cls._conn.commit()
+            return result
+        future = asyncio.get_running_loop().create_future()
+        await cls._write_queue.put((sql, params, many, fetch, future))
+        return await future
+
+    @classmethod
+    async def _execute_write(cls, sql: str, params, many: bool, fetch: bool):
+        if many:
+            cur = await cls._conn.executemany(sql, params)
+        else:
+            cur = await cls._conn.execute(sql, params)
+        # Строки RETURNING нужно выбрать до коммита
+        result = await cur.fetchall() if fetch else (cur.lastrowid, cur.rowcount)
         await cur.close()
-        return row is not None
+        return result
+
+    @classmethod
+    async def _group_commit_loop(cls):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await cls._write_queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            deadline = loop.time() + cls._group_commit_interval
+            while len(batch) < cls._group_commit_max:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(cls._write_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            await cls._flush_writes(batch)
+            if stop:
+                return
+
+    @classmethod
+    async def _flush_writes(cls, batch):
+        done = []
+        for sql, params, many, fetch, future in batch:
+            try:
+                done.append((future, await cls._execute_write(sql, params, many, fetch)))
+            except Exception as e:
+                # Ошибка одного оператора откатывает только его, остальные коммитятся
+                if not future.done():
+                    future.set_exception(e)
+        try:
+            await cls._conn.commit()
+        except Exception as e:
+            await cls._conn.rollback()
+            for future, _ in done:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in done:
+            if not future.done():
+                future.set_result(result)
+
+    @classmethod
+    def add_requests_listener(cls, listener):
+        cls._requests_listeners.append(listener)
+
+    @classmethod
+    def _requests_changed(cls, rows, shifted: bool):
+        # Вызывается после коммита
+        for listener in cls._requests_listeners:
+            listener(rows, shifted)
+
+    # ---------------- USERS ----------------
+    @classmethod
+    async def add_user(cls, user_id: int, first_name: str, last_name: str, phone_number: str):
+        await cls._write(
+            "INSERT OR REPLACE INTO users (user_id, first_name, last_name, phone_number) VALUES (?, ?, ?, ?)",
+            (user_id, first_name, last_name, phone_number)
+        )
+        cls._registered.set(user_id, True)
+
+    @classmethod
+    async def is_registered(cls, user_id: int) -> bool:
+        if cls._registered.get(user_id):
+            return True
+        async with cls._reader() as conn:
+            cur = await conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,))
+            row = await cur.fetchone()
+            await cur.close()
+        if row is None:
+            return False
+        cls._registered.set(user_id, True)
+        return True
+
+    @staticmethod
+    def _preload_registered_sql() -> str:
+        return "SELECT user_id FROM users LIMIT ?"
+
+    @classmethod
+    async def preload_registered(cls):
+        # Прогрев кэша регистраций при старте, не больше его размера. Идет в фоне параллельно
+        # с апдейтами, поэтому счетчики попаданий не сбрасывает: set их не трогает
+        async with cls._reader() as conn:
+            cur = await conn.execute(cls._preload_registered_sql(), (cls._registered.maxsize,))
+            async for row in cur:
+                cls._registered.set(row[0], True)
+            await cur.close()
+
+    @classmethod
+    def registration_cache_stats(cls) -> dict:
+        return cls._registered.stats()
 
     # ---------------- REQUESTS ----------------
     @classmethod
     async def add_request(cls, user_id: int, text: str) -> int:
-        if cls._conn is None:
-            raise RuntimeError("DB not initialized")
-        cur = await cls._conn.execute(
+        last_id, _ = await cls._write(
             "INSERT INTO requests (user_id, text, status) VALUES (?, ?, ?)",
             (user_id, text, "новая")
         )
-        await cls._conn.commit()
-        last_id = cur.lastrowid
-        await cur.close()
+        cls._requests_changed([(last_id, user_id)], True)
         return last_id
 
-    @classmethod
-    async def get_user_requests(cls, user_id: int, hide_completed: bool = True):
-        if cls._conn is None:
-            raise RuntimeError("DB not initialized")
+    # SQL списков вынесен в отдельные методы, чтобы check_query_plans проверял ровно те же запросы
+    @staticmethod
+    def _requests_filter(user_id: Optional[int], hide_completed: bool):
+        where = []
+        params = []
+        if user_id is not None:
+            where.append("user_id = ?")
+            params.append(user_id)
         if hide_completed:
-            cur = await cls._conn.execute("""
-                SELECT id, text, status, created_at
-                FROM requests
-                WHERE user_id = ? AND status != 'отменена'
-                ORDER BY created_at DESC
-            """, (user_id,))
-        else:
-            cur = await cls._conn.execute("""
-                SELECT id, text, status, created_at
-                FROM requests
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-            """, (user_id,))
-        rows = await cur.fetchall()
-        await cur.close()
+            where.append("status != 'отменена'")
+        return where, params
+
+    @classmethod
+    def _requests_page_query(cls, user_id: Optional[int], after: Optional[tuple], before: Optional[tuple],
+                             limit: int, hide_completed: bool):
+        where, params = cls._requests_filter(user_id, hide_completed)
+        if after is not None:
+            where.append("(created_at, id) < (?, ?)")
+            params.extend(after)
+        elif before is not None:
+            where.append("(created_at, id) > (?, ?)")
+            params.extend(before)
+        order = "ASC" if after is None and before is not None else "DESC"
+        sql = "SELECT id, user_id, text, status, created_at FROM requests"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY created_at {order}, id {order} LIMIT ?"
+        params.append(limit)
+        return sql, params
+
+    @classmethod
+    async def get_requests_page(cls, user_id: Optional[int] = None, after: Optional[tuple] = None,
+                                before: Optional[tuple] = None, limit: int = 3, hide_completed: bool = True):
+        # Keyset-пагинация по (created_at, id), от новых к старым.
+        # after - курсор последней строки текущей страницы (листаем вперед),
+        # before - курсор первой строки текущей страницы (листаем назад)
+        sql, params = cls._requests_page_query(user_id, after, before, limit, hide_completed)
+        async with cls._reader() as conn:
+            cur = await conn.execute(sql, params)
+            rows = await cur.fetchall()
+            await cur.close()
+        if after is None and before is not None:
+            rows.reverse()
         return rows
 
     @classmethod
-    async def get_all_requests(cls, hide_completed: bool = False):
-        if cls._conn is None:
-            raise RuntimeError("DB not initialized")
-        if hide_completed:
-            cur = await cls._conn.execute("""
-                SELECT id, user_id, text, status, created_at
-                FROM requests
-                WHERE status != 'отменена'
-                ORDER BY created_at DESC
-            """)
-        else:
-            cur = await cls._conn.execute("""
-                SELECT id, user_id, text, status, created_at
-                FROM requests
-                ORDER BY created_at DESC
-            """)
-        rows = await cur.fetchall()
-        await cur.close()
+    async def iter_requests(cls, chunk_size: int = 1000):
+        # Все заявки пачками по chunk_size тем же keyset-запросом, что и страницы списка.
+        # Соединение для чтения берется на одну пачку, поэтому длинная выгрузка не занимает его целиком
+        after = None
+        while True:
+            rows = await cls.get_requests_page(after=after, limit=chunk_size, hide_completed=False)
+            if rows:
+                yield rows
+            if len(rows) < chunk_size:
+                return
+            after = (rows[-1]["created_at"], rows[-1]["id"])
+
+    @staticmethod
+    def _fts_query(query: str) -> str:
+        # Каждое слово - терм в кавычках, чтобы ввод админа не ломал синтаксис FTS5. Префиксным
+        # делаем только последнее (его могли не дописать) и не короче FTS_MIN_PREFIX: короткий
+        # префикс разворачивается в огромное число термов
+        words = query.split()
+        terms = ['"' + word.replace('"', '""') + '"' for word in words]
+        if words and len(words[-1]) >= Database.FTS_MIN_PREFIX:
+            terms[-1] += "*"
+        return " ".join(terms)
+
+    @staticmethod
+    def _search_requests_sql(with_status: bool) -> str:
+        # bm25 считается только для FTS_RANK_CANDIDATES самых новых совпадений: FTS5 отдает их
+        # по rowid без сортировки, а ORDER BY rank по всем совпадениям ранжировал бы всю выборку
+        status = "WHERE r.status = ?" if with_status else ""
+        return f"""
+            SELECT r.id, r.user_id, r.text, r.status, r.created_at
+            FROM (
+                SELECT rowid AS id, rank
+                FROM requests_fts
+                WHERE requests_fts MATCH ?
+                ORDER BY rowid DESC
+                LIMIT ?
+            ) candidates
+            JOIN requests r ON r.id = candidates.id
+            {status}
+            ORDER BY candidates.rank
+            LIMIT ?
+        """
+
+    @classmethod
+    async def search_requests(cls, query: str, status: Optional[str] = None, limit: int = 10):
+        # Полнотекстовый поиск по заявкам, лучшие совпадения (bm25) первыми
+        fts_query = cls._fts_query(query)
+        if not fts_query:
+            return []
+        candidates = cls.FTS_RANK_CANDIDATES
+        params = (fts_query, candidates, status, limit) if status else (fts_query, candidates, limit)
+        async with cls._reader() as conn:
+            cur = await conn.execute(cls._search_requests_sql(status is not None), params)
+            rows = await cur.fetchall()
+            await cur.close()
         return rows
 
     @classmethod
     async def update_request_status(cls, request_id: int, status: str) -> bool:
-        if cls._conn is None:
-            raise RuntimeError("DB not initialized")
-        cur = await cls._conn.execute("UPDATE requests SET status=? WHERE id=?", (status, request_id))
-        await cls._conn.commit()
-        changed = cur.rowcount > 0
-        await cur.close()
-        return changed
+        rows = await cls._write(
+            "UPDATE requests SET status=? WHERE id=? RETURNING id, user_id", (status, request_id), fetch=True
+        )
+        if rows:
+            # Отмена убирает заявку из списков, остальные статусы меняют строку на месте
+            cls._requests_changed([tuple(row) for row in rows], status == "отменена")
+        return bool(rows)
 
     @classmethod
     async def delete_request(cls, request_id: int) -> bool:
-        if cls._conn is None:
-            raise RuntimeError("DB not initialized")
-        cur = await cls._conn.execute("DELETE FROM requests WHERE id=?", (request_id,))
-        await cls._conn.commit()
-        deleted = cur.rowcount > 0
-        await cur.close()
-        return deleted
+        rows = await cls._write("DELETE FROM requests WHERE id=? RETURNING id, user_id", (request_id,), fetch=True)
+        if rows:
+            cls._requests_changed([tuple(row) for row in rows], True)
+        return bool(rows)
+
+    # Массовая смена статуса трогает только открытые заявки, которые еще не в этом статусе
+    @staticmethod
+    def _bulk_status_by_ids_sql(count: int) -> str:
+        placeholders = ", ".join("?" * count)
+        return (
+            f"UPDATE requests SET status = ? WHERE id IN ({placeholders}) "
+            "AND status NOT IN (?, 'выполнена', 'отменена') RETURNING id, user_id"
+        )
+
+    @staticmethod
+    def _bulk_status_older_sql() -> str:
+        return (
+            "UPDATE requests SET status = ? WHERE created_at < datetime('now', ?) "
+            "AND status NOT IN (?, 'выполнена', 'отменена') RETURNING id, user_id"
+        )
+
+    @classmethod
+    async def bulk_update_status(cls, request_ids: list, status: str) -> list:
+        # Один UPDATE ... WHERE id IN в одной транзакции; возвращает (id, user_id) измененных заявок
+        if not request_ids:
+            return []
+        rows = await cls._write(
+            cls._bulk_status_by_ids_sql(len(request_ids)), (status, *request_ids, status), fetch=True
+        )
+        if rows:
+            cls._requests_changed([tuple(row) for row in rows], status == "отменена")
+        return rows
+
+    @classmethod
+    async def bulk_update_status_older(cls, days: int, status: str) -> list:
+        rows = await cls._write(cls._bulk_status_older_sql(), (status, f"-{days} days", status), fetch=True)
+        if rows:
+            cls._requests_changed([tuple(row) for row in rows], status == "отменена")
+        return rows
+
+    # ---------------- ARCHIVE ----------------
+    # Перенос в архив - два шага: копия в requests_archive, затем удаление из requests того, что уже
+    # скопировано. Оба шага идемпотентны, падение между ними ничего не теряет - следующий проход доделает
+    @staticmethod
+    def _archive_copy_sql() -> str:
+        return """
+            INSERT OR REPLACE INTO requests_archive (id, user_id, text, status, created_at)
+            SELECT id, user_id, text, status, created_at FROM requests
+            WHERE created_at < ? AND status IN ('выполнена', 'отменена')
+            ORDER BY created_at, id LIMIT ?
+        """
+
+    @staticmethod
+    def _archive_delete_sql() -> str:
+        return """
+            DELETE FROM requests WHERE id IN (
+                SELECT r.id FROM requests r
+                WHERE r.created_at < ? AND r.status IN ('выполнена', 'отменена')
+                  AND EXISTS (SELECT 1 FROM requests_archive a WHERE a.id = r.id)
+                ORDER BY r.created_at, r.id LIMIT ?
+            )
+        """
+
+    @staticmethod
+    def _archived_requests_query(user_id: Optional[int], limit: int):
+        sql = "SELECT id, user_id, text, status, created_at, archived_at FROM requests_archive"
+        params = []
+        if user_id is not None:
+            sql += " WHERE user_id = ?"
+            params.append(user_id)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+        return sql, params
+
+    @classmethod
+    async def archive_requests_batch(cls, before: str, limit: int) -> int:
+        # Переносит до limit закрытых заявок, созданных раньше before; возвращает число перенесенных
+        await cls._write(cls._archive_copy_sql(), (before, limit))
+        _, rowcount = await cls._write(cls._archive_delete_sql(), (before, limit))
+        if rowcount:
+            cls._requests_changed(None, True)
+        return rowcount
+
+    @classmethod
+    async def get_archived_requests(cls, user_id: Optional[int] = None, limit: int = 10):
+        sql, params = cls._archived_requests_query(user_id, limit)
+        async with cls._reader() as conn:
+            cur = await conn.execute(sql, params)
+            rows = await cur.fetchall()
+            await cur.close()
+        return rows
+
+    @classmethod
+    async def vacuum_incremental(cls, pages: int):
+        # Отдает ФС до pages свободных страниц; при auto_vacuum != INCREMENTAL ничего не делает
+        await cls._write(f"PRAGMA incremental_vacuum({int(pages)})", (), fetch=True)
+
+    @classmethod
+    async def optimize(cls):
+        await cls._write("PRAGMA optimize", (), fetch=True)
+
+    # ---------------- REMINDERS ----------------
+    @classmethod
+    async def add_reminder(cls, chat_id: int, text: str, due_at: float) -> int:
+        last_id, _ = await cls._write(
+            "INSERT INTO reminders (chat_id, text, due_at) VALUES (?, ?, ?)",
+            (chat_id, text, due_at)
+        )
+        return last_id
+
+    @staticmethod
+    def _claim_reminders_sql() -> str:
+        return """
+            UPDATE reminders SET status = 'sending'
+            WHERE id IN (
+                SELECT id FROM reminders
+                WHERE status = 'pending' AND due_at <= ?
+                ORDER BY due_at
+                LIMIT ?
+            )
+            RETURNING id, chat_id, text, due_at
+        """
+
+    @classmethod
+    async def claim_due_reminders(cls, now: float, limit: int = 100):
+        # Наступившие напоминания переводятся в 'sending' одним оператором: пока идет отправка,
+        # их не выберет повторно ни этот цикл, ни планировщик после рестарта
+        return await cls._write(cls._claim_reminders_sql(), (now, limit), fetch=True)
+
+    @classmethod
+    async def release_reminders(cls) -> int:
+        # Захваченные процессом, который упал до записи итогов, снова становятся pending
+        _, count = await cls._write("UPDATE reminders SET status = 'pending' WHERE status = 'sending'", ())
+        return count
+
+    @classmethod
+    async def next_reminder_due(cls) -> Optional[float]:
+        async with cls._reader() as conn:
+            cur = await conn.execute("SELECT MIN(due_at) FROM reminders WHERE status = 'pending'")
+            row = await cur.fetchone()
+            await cur.close()
+        return row[0]
+
+    @classmethod
+    async def save_reminder_results(cls, results: list):
+        # results - список (status, delivered_at, id), все итоги одной транзакцией;
+        # status 'pending' возвращает неотправленное напоминание в очередь
+        if not results:
+            return
+        await cls._write("UPDATE reminders SET status = ?, delivered_at = ? WHERE id = ?", results, many=True)
+
+    # ---------------- FSM ----------------
+    @classmethod
+    async def get_fsm_record(cls, key: str, now: float):
+        async with cls._reader() as conn:
+            cur = await conn.execute(
+                "SELECT state, data FROM fsm_storage WHERE key = ? AND expires_at > ?", (key, now)
+            )
+            row = await cur.fetchone()
+            await cur.close()
+        return row
+
+    @classmethod
+    async def save_fsm_records(cls, records: list):
+        # records: [(key, state, data_json, expires_at)]
+        if not records:
+            return
+        await cls._write("""
+            INSERT INTO fsm_storage (key, state, data, expires_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data,
+                expires_at = excluded.expires_at
+        """, records, many=True)
+
+    @classmethod
+    async def delete_fsm_records(cls, keys: list):
+        if not keys:
+            return
+        await cls._write("DELETE FROM fsm_storage WHERE key = ?", [(key,) for key in keys], many=True)
+
+    @classmethod
+    async def delete_expired_fsm_records(cls, now: float) -> int:
+        _, rowcount = await cls._write("DELETE FROM fsm_storage WHERE expires_at <= ?", (now,))
+        return rowcount
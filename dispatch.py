@@ -0,0 +1,69 @@
+import inspect
+from aiogram import types
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+
+
+class DispatchTable:
+    # Точные тексты кнопок, команды, типы контента, FSM-состояния и префиксы callback_data
+    # разложены по словарям, так что выбор обработчика - несколько поисков в dict,
+    # а не последовательная проверка фильтров роутера. Порядок для сообщений:
+    # отдельный тип контента (контакт, локация) -> команда -> FSM-состояние -> текст кнопки.
+
+    def __init__(self):
+        self._content_types = {}
+        self._commands = {}
+        self._states = {}
+        self._texts = {}
+        self._callbacks = {}
+        self._with_state = set()
+
+    def _add(self, table: dict, key, handler):
+        if key in table:
+            raise ValueError(f"Обработчик для {key!r} уже зарегистрирован")
+        table[key] = handler
+        if "state" in inspect.signature(handler).parameters:
+            self._with_state.add(handler)
+
+    def content_type(self, content_type: str, handler):
+        self._add(self._content_types, content_type, handler)
+
+    def command(self, command: str, handler):
+        self._add(self._commands, "/" + command, handler)
+
+    def state(self, state: State, handler):
+        self._add(self._states, state.state, handler)
+
+    def text(self, text: str, handler):
+        self._add(self._texts, text, handler)
+
+    def callback(self, prefix: str, handler):
+        # prefix - часть callback_data до первого ":" (или вся строка, если ":" нет)
+        self._add(self._callbacks, prefix, handler)
+
+    async def match_message(self, message: types.Message, state: FSMContext):
+        # Фильтр aiogram: найденный обработчик попадает в data["target"]
+        handler = self._content_types.get(message.content_type)
+        if handler:
+            return {"target": handler}
+        text = message.text
+        if text and text.startswith("/"):
+            handler = self._commands.get(text.split(maxsplit=1)[0].split("@", 1)[0])
+            if handler:
+                return {"target": handler}
+        if self._states:
+            current = await state.get_state()
+            handler = self._states.get(current) if current else None
+            if handler:
+                return {"target": handler}
+        handler = self._texts.get(text) if text is not None else None
+        return {"target": handler} if handler else False
+
+    async def match_callback(self, callback: types.CallbackQuery):
+        handler = self._callbacks.get((callback.data or "").split(":", 1)[0])
+        return {"target": handler} if handler else False
+
+    async def call(self, target, event, state: FSMContext):
+        if target in self._with_state:
+            return await target(event, state)
+        return await target(event)
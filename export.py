@@ -0,0 +1,46 @@
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+from database import Database
+
+FORMATS = ("csv", "jsonl")
+COLUMNS = ("id", "user_id", "text", "status", "created_at")
+
+
+def _open(path: str, compress: bool):
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def _write_chunk(file, fmt: str, rows: list):
+    if fmt == "csv":
+        csv.writer(file).writerows(rows)
+    else:
+        file.writelines(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows)
+
+
+async def export_requests(fmt: str = "csv", compress: bool = False, chunk_size: int = 1000) -> str:
+    # Выгрузка всех заявок во временный файл, возвращает путь; удалить файл - забота вызывающего.
+    # Строки читаются пачками по chunk_size через Database.iter_requests, запись и сжатие
+    # идут в потоке, поэтому память не зависит от размера таблицы и цикл событий не блокируется
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+    fd, path = tempfile.mkstemp(prefix="requests-", suffix=f".{fmt}.gz" if compress else f".{fmt}")
+    os.close(fd)
+    try:
+        file = await asyncio.to_thread(_open, path, compress)
+        try:
+            if fmt == "csv":
+                await asyncio.to_thread(csv.writer(file).writerow, COLUMNS)
+            async for rows in Database.iter_requests(chunk_size):
+                await asyncio.to_thread(_write_chunk, file, fmt, [tuple(row) for row in rows])
+        finally:
+            await asyncio.to_thread(file.close)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
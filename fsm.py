@@ -13,3 +13,7 @@ class ReminderState(StatesGroup):
     choosing_time = State()
     entering_custom_time = State()
     entering_text = State()
+
+
+class SearchState(StatesGroup):
+    entering_query = State()
@@ -1,96 +1,138 @@
-import aiohttp
-import asyncio
-
-from aiogram import F, types, Router, Bot, exceptions
-from aiogram.filters import CommandStart
-from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton
+from aiogram import types, Router, exceptions
+from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
+from aiogram.types import FSInputFile, BufferedInputFile
+import os
 from datetime import datetime
-from zoneinfo import ZoneInfo
+from functools import lru_cache
 from database import Database
-from midleware import RegistrationMiddleware
-from fsm import UserRegistration, RequestState, ReminderState
+from midleware import RegistrationMiddleware, InstrumentationMiddleware, ThrottlingMiddleware
+from fsm import UserRegistration, RequestState, ReminderState, SearchState
+from scheduler import ReminderScheduler
+from notifier import Notifier
+from rates import RatesClient, RatesRefresher
+from keyboards import Keyboards, BULK_STATUS
+from dispatch import DispatchTable
+from cache import PageCache
+from export import export_requests, FORMATS
+from profiling import profile_loop
+
+
+# Лимит Telegram на длину текста сообщения
+MESSAGE_LIMIT = 4096
+
+
+def clip(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+@lru_cache(maxsize=None)
+def minsk_tz():
+    # Данные часового пояса читаются при первом запросе времени, а не на старте
+    from zoneinfo import ZoneInfo
+    return ZoneInfo("Europe/Minsk")
+
 
 class BotHandlers:
     ADMINS = []
     REQUESTS_PER_PAGE = 3
-
-    def __init__(self, url: str):
+    SEARCH_LIMIT = 10
+    ARCHIVE_LIMIT = 10
+    PROFILE_MAX_SECONDS = 300
+    # Сколько символов текста заявки показывать в списках: 10 заявок должны влезть в одно сообщение
+    ITEM_TEXT_LIMIT = 300
+    # Сколько id заявок перечислять в одном уведомлении о смене статуса
+    NOTIFY_IDS_LIMIT = 20
+
+    def __init__(self, url: str, scheduler: ReminderScheduler, notifier: Notifier, page_cache_size: int = 2000):
         self.url = url
+        self.scheduler = scheduler
+        self.notifier = notifier
+        # Готовые страницы списков заявок; Database сообщает об изменениях строк после коммита
+        self.page_cache = PageCache(maxsize=page_cache_size)
+        Database.add_requests_listener(self.page_cache.invalidate)
+        self.rates = RatesClient(url)
+        self.rates_refresher = RatesRefresher(self.rates)
+        self.keyboards = Keyboards()
         self.router = Router()
+        self.dispatch = DispatchTable()
+        self._profiling = False
 
         # Команды без регистрации
-        self.router.message.register(self.start_cmd, CommandStart())
-        self.router.message.register(self.user_registration_start, F.text == "📝 Зарегистрироваться")
-        self.router.message.register(self.receive_contact, F.content_type == "contact")
+        self.dispatch.command("start", self.start_cmd)
+        self.dispatch.text("📝 Зарегистрироваться", self.user_registration_start)
+        self.dispatch.content_type("contact", self.receive_contact)
 
         # Главное меню кнопки
-        self.router.message.register(self.about_cmd, F.text == "О боте")
-        self.router.message.register(self.handle_time, F.text == "⏱ Время")
-        self.router.message.register(self.ask_city_for_currency, F.text == "Курс валют")
-        self.router.message.register(self.handle_remind, F.text == "🔔 Напоминание")
-        self.router.message.register(self.handle_location, F.content_type == "location")
+        self.dispatch.text("О боте", self.about_cmd)
+        self.dispatch.text("⏱ Время", self.handle_time)
+        self.dispatch.text("Курс валют", self.ask_city_for_currency)
+        self.dispatch.text("🔔 Напоминание", self.handle_remind)
+        self.dispatch.content_type("location", self.handle_location)
 
         # Callback-и
-        self.router.callback_query.register(self.handle_city_selected, F.data.startswith("city:"))
-        self.router.callback_query.register(self.choose_ready_time, F.data.startswith("rem_time"))
-        self.router.callback_query.register(self.choose_custom_interval, F.data == "rem_custom")
-        self.router.callback_query.register(self.handle_page_callback, F.data.startswith("page:"))
+        self.dispatch.callback("city", self.handle_city_selected)
+        self.dispatch.callback("rem_time", self.choose_ready_time)
+        self.dispatch.callback("rem_custom", self.choose_custom_interval)
+        self.dispatch.callback("page", self.handle_page_callback)
 
         # FSM Handlers
-        self.router.message.register(self.save_custom_interval, ReminderState.entering_custom_time)
-        self.router.message.register(self.save_reminder_text, ReminderState.entering_text)
-
-        # Middleware
-        self.router.message.middleware.register(RegistrationMiddleware())
+        self.dispatch.state(ReminderState.entering_custom_time, self.save_custom_interval)
+        self.dispatch.state(ReminderState.entering_text, self.save_reminder_text)
 
         # Заявки
-        self.router.message.register(self.create_request_start, F.text == "➕ Создать заявку")
-        self.router.message.register(self.save_request, RequestState.entering_text)
-        self.router.message.register(self.show_user_requests, F.text == "📄 Мои заявки")
-        self.router.callback_query.register(self.cancel_request, F.data.startswith("cancel:"))
+        self.dispatch.text("➕ Создать заявку", self.create_request_start)
+        self.dispatch.state(RequestState.entering_text, self.save_request)
+        self.dispatch.text("📄 Мои заявки", self.show_user_requests)
+        self.dispatch.callback("cancel", self.cancel_request)
 
         # Админка
-        self.router.message.register(self.show_all_requests, F.text == "📋 Все заявки")
-        self.router.callback_query.register(self.change_status, F.data.startswith("status:"))
+        self.dispatch.text("📋 Все заявки", self.show_all_requests)
+        self.dispatch.callback("status", self.change_status)
+        self.dispatch.callback("bulk", self.bulk_status_page)
+        self.dispatch.command("done_older", self.bulk_status_older)
+        self.dispatch.command("archive", self.show_archive)
+        self.dispatch.command("export", self.export_cmd)
+        self.dispatch.command("profile", self.profile_cmd)
+        self.dispatch.command("search", self.search_cmd)
+        self.dispatch.text("🔎 Поиск заявок", self.search_cmd)
+        self.dispatch.state(SearchState.entering_query, self.save_search_query)
+
+        # Один обработчик на тип события, выбор цели - по таблице
+        self.router.message.register(self.dispatch_event, self.dispatch.match_message)
+        self.router.callback_query.register(self.dispatch_event, self.dispatch.match_callback)
+
+        # Middleware
+        self.router.message.middleware.register(InstrumentationMiddleware())
+        self.router.callback_query.middleware.register(InstrumentationMiddleware())
+        throttling = ThrottlingMiddleware(exempt=lambda user_id: user_id in BotHandlers.ADMINS)
+        self.router.message.middleware.register(throttling)
+        self.router.callback_query.middleware.register(throttling)
+        self.router.message.middleware.register(RegistrationMiddleware())
+
+    async def dispatch_event(self, event: types.TelegramObject, state: FSMContext, target):
+        return await self.dispatch.call(target, event, state)
 
     # --------------------
     # START / REGISTRATION
     # --------------------
-    async def main_menu(self, user_id: int):
-        keyboard = [
-            [KeyboardButton(text="Курс валют"), KeyboardButton(text="⏱ Время")],
-            [KeyboardButton(text="🔔 Напоминание"), KeyboardButton(text="📍 Отправить локацию", request_location=True)],
-            [KeyboardButton(text="➕ Создать заявку"), KeyboardButton(text="📄 Мои заявки")]
-        ]
-        if user_id in BotHandlers.ADMINS:
-            keyboard.append([KeyboardButton(text="📋 Все заявки")])
-        return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
+    def main_menu(self, user_id: int):
+        return self.keyboards.main_menu(user_id in BotHandlers.ADMINS)
 
     async def start_cmd(self, message: types.Message):
         if await Database.is_registered(message.from_user.id):
             await message.answer(
                 text="👋 С возвращением!",
-                reply_markup=await self.main_menu(message.from_user.id)
+                reply_markup=self.main_menu(message.from_user.id)
             )
         else:
-            keyboard = ReplyKeyboardMarkup(
-                keyboard=[[KeyboardButton(text="📝 Зарегистрироваться", request_contact=False)]],
-                resize_keyboard=True,
-                one_time_keyboard=True
-            )
             await message.answer(
                 f"👋 Привет, {message.from_user.first_name}!\nНажми кнопку для регистрации",
-                reply_markup=keyboard
+                reply_markup=self.keyboards.register
             )
 
     async def user_registration_start(self, message: types.Message, state: FSMContext):
-        keyboard = ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(text="Отправить контакт", request_contact=True)]],
-            resize_keyboard=True,
-            one_time_keyboard=True
-        )
-        await message.answer("Для регистрации отправь контакт 📲", reply_markup=keyboard)
+        await message.answer("Для регистрации отправь контакт 📲", reply_markup=self.keyboards.send_contact)
         await state.set_state(UserRegistration.number)
 
     async def receive_contact(self, message: types.Message, state: FSMContext):
@@ -107,7 +149,7 @@ class BotHandlers:
         )
         await message.answer(
             f"✅ Ты зарегистрирован как {contact.first_name} {contact.last_name or ''} {contact.phone_number}",
-            reply_markup=await self.main_menu(message.from_user.id)
+            reply_markup=self.main_menu(message.from_user.id)
         )
         await state.clear()
 
@@ -119,16 +161,11 @@ class BotHandlers:
         await message.answer("🤖 Я крутой бот!")
 
     async def handle_time(self, message: types.Message):
-        now = datetime.now(ZoneInfo("Europe/Minsk"))
+        now = datetime.now(minsk_tz())
         await message.answer(f"⏰ Сейчас в Минске: {now.strftime('%H:%M:%S')}")
 
     async def ask_city_for_currency(self, message: types.Message):
-        kb = InlineKeyboardBuilder()
-        cities = ["Минск", "Брест", "Гродно", "Гомель", "Витебск", "Могилев"]
-        for city in cities:
-            kb.button(text=city, callback_data=f"city:{city}")
-        kb.adjust(2)
-        await message.answer("Выбери город:", reply_markup=kb.as_markup())
+        await message.answer("Выбери город:", reply_markup=self.keyboards.cities)
 
     async def handle_city_selected(self, callback: types.CallbackQuery):
         city = callback.data.split(":")[1]
@@ -136,37 +173,18 @@ class BotHandlers:
         await self.send_currency(callback.message, city)
 
     async def send_currency(self, message: types.Message, city: str):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(self.url, params={"city": city}) as resp:
-                data = await resp.json()
-        if not data:
+        # Обычно курсы уже лежат в снимке фонового обновления, наверх идем только на холодном старте
+        text = await self.rates_refresher.get_text(city)
+        if not text:
             await message.answer("❌ Не удалось получить данные.")
             return
-        branch = data[0]
-        usd_in = float(branch["USD_in"])
-        usd_out = float(branch["USD_out"])
-        rub_in = float(branch["RUB_in"]) / 100
-        rub_out = float(branch["RUB_out"]) / 100
-        cny_in = float(branch["CNY_in"]) / 10
-        cny_out = float(branch["CNY_out"]) / 10
-        await message.answer(
-            f"*Курс валют в {city}:*\n"
-            f"💵 USD: {usd_in:.4f}/{usd_out:.4f}\n"
-            f"🇷🇺 RUB: {rub_in:.4f}/{rub_out:.4f}\n"
-            f"🇨🇳 CNY: {cny_in:.4f}/{cny_out:.4f}",
-            parse_mode="Markdown"
-        )
+        await message.answer(text, parse_mode="Markdown")
 
     # --------------------
     # REMINDER
     # --------------------
     async def handle_remind(self, message: types.Message, state: FSMContext):
-        kb = InlineKeyboardBuilder()
-        for m in [1, 5, 10, 30]:
-            kb.button(text=f"{m} мин", callback_data=f"rem_time:{m}")
-        kb.button(text="Свой интервал ⌨️", callback_data="rem_custom")
-        kb.adjust(2)
-        await message.answer("⏱ Выбери интервал или введи свой:", reply_markup=kb.as_markup())
+        await message.answer("⏱ Выбери интервал или введи свой:", reply_markup=self.keyboards.remind)
         await state.set_state(ReminderState.choosing_time)
 
     async def choose_ready_time(self, callback: types.CallbackQuery, state: FSMContext):
@@ -196,13 +214,9 @@ class BotHandlers:
         data = await state.get_data()
         minutes = data["minutes"]
         await message.answer(f"🔔 Ок! Напомню через {minutes} минут.")
-        asyncio.create_task(self.send_reminder(message.bot, message.chat.id, minutes, text))
+        await self.scheduler.schedule(message.chat.id, text, minutes)
         await state.clear()
 
-    async def send_reminder(self, bot: Bot, chat_id: int, minutes: int, text: str):
-        await asyncio.sleep(minutes * 60)
-        await bot.send_message(chat_id, f"⏰ Напоминание: {text}")
-
     async def handle_location(self, message: types.Message):
         if not message.location:
             await message.answer("Пожалуйста, отправь свою локацию через кнопку 📍")
@@ -214,163 +228,310 @@ class BotHandlers:
         await message.answer(f"Вот твоя локация:\nШирота: {latitude}\nДолгота: {longitude}")
 
     async def create_request_start(self, message: types.Message, state: FSMContext):
-        kb = ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(text="Отменить")]],
-            resize_keyboard=True,
-            one_time_keyboard=True
-        )
-        await message.answer("📝 Введи текст заявки:", reply_markup=kb)
+        await message.answer("📝 Введи текст заявки:", reply_markup=self.keyboards.cancel_request)
         await state.set_state(RequestState.entering_text)
 
     async def save_request(self, message: types.Message, state: FSMContext):
         if message.text.lower() == "отменить":
-            await message.answer("❌ Заявка отменена", reply_markup=await self.main_menu(message.from_user.id))
+            await message.answer("❌ Заявка отменена", reply_markup=self.main_menu(message.from_user.id))
             await state.clear()
             return
 
         request_id = await Database.add_request(user_id=message.from_user.id, text=message.text)
 
-        await message.answer("✅ Заявка принята!", reply_markup=await self.main_menu(message.from_user.id))
+        await message.answer("✅ Заявка принята!", reply_markup=self.main_menu(message.from_user.id))
         await state.clear()
 
+        # Уведомления админам уходят через очередь, пользователь их не ждет
+        markup = self.keyboards.status_keyboard(request_id)
+        # Без Markdown: в тексте заявки и имени могут быть *, _ и [, которые Telegram не разберет
+        header = f"📢 Новая заявка от {message.from_user.full_name}:\n\n"
+        footer = f"\n\nID заявки: {request_id}"
+        text = header + clip(message.text, MESSAGE_LIMIT - len(header) - len(footer)) + footer
         for admin_id in BotHandlers.ADMINS:
-            try:
-                kb = InlineKeyboardBuilder()
-                kb.button(text="✅ В работе", callback_data=f"status:{request_id}:в работе")
-                kb.button(text="✅ Выполнено", callback_data=f"status:{request_id}:выполнена")
-                kb.button(text="❌ Отменить", callback_data=f"status:{request_id}:отменена")
-                kb.adjust(3)
-
-                await message.bot.send_message(
-                    chat_id=admin_id,
-                    text=(
-                        f"📢 Новая заявка от {message.from_user.full_name}:\n\n"
-                        f"{message.text}\n\n"
-                        f"ID заявки: {request_id}"
-                    ),
-                    parse_mode="Markdown",
-                    reply_markup=kb.as_markup()
-                )
-            except Exception as e:
-                print(f"Не удалось отправить уведомление админу {admin_id}: {e}")
-
-    def build_requests_keyboard(self, requests, page=0, is_admin=False):
+            await self.notifier.send(admin_id, text, reply_markup=markup)
+
+    @staticmethod
+    def status_display(status: str) -> str:
+        if status.lower() == "новая":
+            return "🔵 Новая"
+        elif status.lower() == "в работе":
+            return "🟡 В работе"
+        elif status.lower() == "выполнена":
+            return "🟢 Выполнена"
+        return status
+
+    @staticmethod
+    def render_items(header: str, items) -> str:
+        # Тексты заявок уже обрезаны до ITEM_TEXT_LIMIT, общий clip - страховка от лимита Telegram
+        return clip("\n\n".join([header, *items]), MESSAGE_LIMIT)
+
+    def render_requests_page(self, requests_page, page: int, is_admin: bool) -> str:
+        # Без общего числа страниц: COUNT(*) по всей таблице на каждый показ растет вместе с ней.
+        # Без Markdown: текст заявки пользовательский и может сломать разметку
+        limit = BotHandlers.ITEM_TEXT_LIMIT
+        if is_admin:
+            header = f"📋 Все заявки (стр. {page + 1}):"
+            items = [
+                f"ID: {r['id']}\nПользователь: {r['user_id']}\nТекст: {clip(r['text'], limit)}\nСтатус: {r['status']}"
+                for r in requests_page
+            ]
+        else:
+            header = f"📄 Твои заявки (стр. {page + 1}):"
+            items = [
+                f"ID: {r['id']}\nТекст: {clip(r['text'], limit)}\nСтатус: {self.status_display(r['status'])}"
+                for r in requests_page
+            ]
+        return self.render_items(header, items)
+
+    def build_requests_keyboard(self, requests_page, page: int, has_next: bool, is_admin: bool = False):
+        # Кнопки заявок страницы и навигация в одной клавиатуре.
+        # Курсор keyset-пагинации кладем прямо в callback_data: a<created_at>|<id> - вперед, b... - назад
         kb = InlineKeyboardBuilder()
-        start = page * BotHandlers.REQUESTS_PER_PAGE
-        end = start + BotHandlers.REQUESTS_PER_PAGE
-        for r in requests[start:end]:
+        for r in requests_page:
             if is_admin:
-                kb.button(text="✅ В работе", callback_data=f"status:{r[0]}:в работе")
-                kb.button(text="✅ Выполнено", callback_data=f"status:{r[0]}:выполнена")
-                kb.button(text="❌ Отменить", callback_data=f"status:{r[0]}:отменена")
+                kb.row(*self.keyboards.status_buttons(r["id"], numbered=True))
             else:
-                kb.button(text="❌ Отменить", callback_data=f"cancel:{r[0]}")
-        kb.adjust(3 if is_admin else 1)
+                kb.row(InlineKeyboardButton(text=f"❌ Отменить #{r['id']}", callback_data=f"cancel:{r['id']}"))
+        if is_admin and len(requests_page) > 1:
+            kb.row(self.keyboards.bulk_status_button(tuple(r["id"] for r in requests_page)))
 
         # Навигация страниц
-        total_pages = (len(requests) - 1) // BotHandlers.REQUESTS_PER_PAGE
+        view = "admin" if is_admin else "user"
         nav_buttons = []
-        if page > 0:
+        if requests_page and page > 0:
+            first = requests_page[0]
             nav_buttons.append(InlineKeyboardButton(
                 text="⬅️ Назад",
-                callback_data=f"page:{page - 1}:{'admin' if is_admin else 'user'}")
+                callback_data=f"page:{page - 1}:{view}:b{first['created_at']}|{first['id']}")
             )
-        if page < total_pages:
+        if requests_page and has_next:
+            last = requests_page[-1]
             nav_buttons.append(InlineKeyboardButton(
                 text="➡️ Вперед",
-                callback_data=f"page:{page + 1}:{'admin' if is_admin else 'user'}")
+                callback_data=f"page:{page + 1}:{view}:a{last['created_at']}|{last['id']}")
             )
         if nav_buttons:
             kb.row(*nav_buttons)
 
         return kb.as_markup()
 
-    async def show_user_requests(self, message: types.Message, page: int = 0, user_id: int = None):
+    async def load_requests_page(self, user_id: int, page: int, after: tuple, before: tuple, is_admin: bool):
+        # (текст, разметка) страницы или None, если заявок нет. Повторный показ той же страницы
+        # берется из page_cache без запросов к БД и без рендера
+        view, owner_id = ("admin", None) if is_admin else ("user", user_id)
+        cursor = (page, after, before)
+        cached = self.page_cache.get(view, owner_id, cursor)
+        if cached is not None:
+            return cached[:2]
+        generation = self.page_cache.generation
+        # Одна лишняя строка показывает, есть ли следующая страница, без COUNT(*)
+        per_page = BotHandlers.REQUESTS_PER_PAGE
+        requests_page = await Database.get_requests_page(
+            user_id=owner_id, after=after, before=before, limit=per_page + 1
+        )
+        if before is not None:
+            # Листаем назад: лишняя строка - самая новая, в начале; следующая страница точно есть
+            requests_page, has_next = requests_page[-per_page:], True
+        else:
+            requests_page, has_next = requests_page[:per_page], len(requests_page) > per_page
+        if not requests_page:
+            if after is None and before is None:
+                return None
+            # Страница опустела (заявки закрыли или удалили) - показываем первую
+            return await self.load_requests_page(user_id, 0, None, None, is_admin)
+        text = self.render_requests_page(requests_page, page, is_admin)
+        markup = self.build_requests_keyboard(requests_page, page, has_next, is_admin)
+        self.page_cache.set(view, owner_id, cursor, text, markup, [r["id"] for r in requests_page], generation)
+        return text, markup
+
+    async def send_requests_page(self, message: types.Message, text: str, markup, edit: bool):
+        # Вся страница - одно сообщение; при листании оно редактируется на месте
+        if not edit:
+            await message.answer(text, reply_markup=markup)
+            return
+        try:
+            await message.edit_text(text, reply_markup=markup)
+        except exceptions.TelegramBadRequest as e:
+            # Повторное нажатие на ту же страницу - не ошибка, остальное пробрасываем
+            if "message is not modified" not in str(e):
+                raise
+
+    async def show_user_requests(self, message: types.Message, page: int = 0, user_id: int = None,
+                                 after: tuple = None, before: tuple = None, edit: bool = False):
         user_id = user_id or message.from_user.id
-        requests = await Database.get_user_requests(user_id, hide_completed=True)
-        if not requests:
+        rendered = await self.load_requests_page(user_id, page, after, before, is_admin=False)
+        if rendered is None:
             await message.answer("У тебя нет заявок")
             return
+        await self.send_requests_page(message, *rendered, edit=edit)
 
-        start = page * BotHandlers.REQUESTS_PER_PAGE
-        end = start + BotHandlers.REQUESTS_PER_PAGE
-        requests_page = requests[start:end]
-
-        for r in requests_page:
-            kb = InlineKeyboardBuilder()
-            kb.button(text="❌ Отменить", callback_data=f"cancel:{r[0]}")
-            kb.adjust(3)
-            status = r[2]
-
-            if status.lower() == "новая":
-                status_display = "🔵 Новая"
-            elif status.lower() == "в работе":
-                status_display = "🟡 В работе"
-            elif status.lower() == "выполнена":
-                status_display = "🟢 Выполнена"
-            else:
-                status_display = status
-
-            await message.answer(
-                f"ID: {r[0]}\nТекст: {r[1]}\nСтатус: *{status_display}*",
-                parse_mode="Markdown",
-                reply_markup=kb.as_markup()
-            )
-
-        total_pages = (len(requests) - 1) // BotHandlers.REQUESTS_PER_PAGE
-        if total_pages > 0:
-            nav_kb = InlineKeyboardBuilder()
-            if page > 0:
-                nav_kb.button(text="⬅️ Назад", callback_data=f"page:{page - 1}:user")
-            if page < total_pages:
-                nav_kb.button(text="➡️ Вперед", callback_data=f"page:{page + 1}:user")
-            nav_kb.adjust(2)
-            await message.answer("Страницы:", reply_markup=nav_kb.as_markup())
-
-    async def show_all_requests(self, message: types.Message, page: int = 0, user_id: int = None):
+    async def show_all_requests(self, message: types.Message, page: int = 0, user_id: int = None,
+                                after: tuple = None, before: tuple = None, edit: bool = False):
         user_id = user_id or message.from_user.id
         if user_id not in BotHandlers.ADMINS:
             await message.answer("❌ Доступ запрещен")
             return
-        requests = await Database.get_all_requests(hide_completed=True)
-        if not requests:
+        rendered = await self.load_requests_page(user_id, page, after, before, is_admin=True)
+        if rendered is None:
             await message.answer("Заявок нет")
             return
+        await self.send_requests_page(message, *rendered, edit=edit)
+
+    async def search_cmd(self, message: types.Message, state: FSMContext):
+        if message.from_user.id not in BotHandlers.ADMINS:
+            await message.answer("❌ Доступ запрещен")
+            return
+        # /search <текст> ищет сразу, без текста - спрашиваем запрос
+        parts = message.text.split(maxsplit=1) if message.text.startswith("/") else []
+        if len(parts) > 1:
+            await self.send_search_results(message, parts[1])
+            return
+        await message.answer("🔎 Введи текст для поиска по заявкам:")
+        await state.set_state(SearchState.entering_query)
 
-        start = page *BotHandlers. REQUESTS_PER_PAGE
-        end = start + BotHandlers.REQUESTS_PER_PAGE
-        requests_page = requests[start:end]
+    async def save_search_query(self, message: types.Message, state: FSMContext):
+        await state.clear()
+        if not message.text:
+            await message.answer("❗ Введи текст для поиска")
+            return
+        await self.send_search_results(message, message.text)
 
-        for r in requests_page:
-            kb = InlineKeyboardBuilder()
-            kb.button(text="✅ В работе", callback_data=f"status:{r[0]}:в работе")
-            kb.button(text="✅ Выполнено", callback_data=f"status:{r[0]}:выполнена")
-            kb.button(text="❌ Отменить", callback_data=f"status:{r[0]}:отменена")
-            kb.adjust(3)
-            await message.answer(f"ID: {r[0]}\nПользователь: {r[1]}\nТекст: {r[2]}\nСтатус: {r[3]}",
-                                 reply_markup=kb.as_markup())
-
-        total_pages = (len(requests) - 1) // BotHandlers.REQUESTS_PER_PAGE
-        if total_pages > 0:
-            nav_kb = InlineKeyboardBuilder()
-            if page > 0:
-                nav_kb.button(text="⬅️ Назад", callback_data=f"page:{page - 1}:admin")
-            if page < total_pages:
-                nav_kb.button(text="➡️ Вперед", callback_data=f"page:{page + 1}:admin")
-            nav_kb.adjust(2)
-            await message.answer("Страницы:", reply_markup=nav_kb.as_markup())
+    async def send_search_results(self, message: types.Message, query: str):
+        results = await Database.search_requests(query, limit=BotHandlers.SEARCH_LIMIT)
+        if not results:
+            await message.answer("Ничего не найдено")
+            return
+        limit = BotHandlers.ITEM_TEXT_LIMIT
+        items = [
+            f"ID: {r['id']}\nПользователь: {r['user_id']}\nТекст: {clip(r['text'], limit)}\nСтатус: {r['status']}"
+            for r in results
+        ]
+        kb = InlineKeyboardBuilder()
+        for r in results:
+            kb.row(*self.keyboards.status_buttons(r["id"], numbered=True))
+        await message.answer(self.render_items(f"🔎 Найдено: {len(results)}", items), reply_markup=kb.as_markup())
+
+    async def show_archive(self, message: types.Message):
+        # /archive - последние заявки из архива, /archive <user_id> - архив одного пользователя
+        if message.from_user.id not in BotHandlers.ADMINS:
+            await message.answer("❌ Доступ запрещен")
+            return
+        parts = message.text.split()
+        try:
+            user_id = int(parts[1]) if len(parts) > 1 else None
+        except ValueError:
+            await message.answer("❗ Используй: /archive [user_id]")
+            return
+        rows = await Database.get_archived_requests(user_id, limit=BotHandlers.ARCHIVE_LIMIT)
+        if not rows:
+            await message.answer("В архиве пусто")
+            return
+        limit = BotHandlers.ITEM_TEXT_LIMIT
+        items = [
+            f"ID: {r['id']}\nПользователь: {r['user_id']}\nТекст: {clip(r['text'], limit)}\nСтатус: {r['status']}\n"
+            f"Создана: {r['created_at']}, в архиве с {r['archived_at']}"
+            for r in rows
+        ]
+        await message.answer(self.render_items(f"📦 Архив заявок (последние {len(rows)}):", items))
+
+    async def export_cmd(self, message: types.Message):
+        # /export [csv|jsonl] [gz] - все заявки файлом; выгрузка идет пачками и не мешает другим обновлениям
+        if message.from_user.id not in BotHandlers.ADMINS:
+            await message.answer("❌ Доступ запрещен")
+            return
+        args = message.text.split()[1:]
+        fmt = args[0] if args else "csv"
+        compress = "gz" in args[1:]
+        if fmt not in FORMATS:
+            await message.answer("❗ Используй: /export [csv|jsonl] [gz]")
+            return
+        await message.answer("⏳ Готовлю выгрузку…")
+        try:
+            path = await export_requests(fmt, compress)
+        except Exception:
+            await message.answer("Ошибка при работе с БД")
+            return
+        try:
+            filename = f"requests-{datetime.now().strftime('%Y%m%d-%H%M')}.{fmt}" + (".gz" if compress else "")
+            await message.answer_document(FSInputFile(path, filename=filename))
+        finally:
+            os.remove(path)
+
+    async def profile_cmd(self, message: types.Message):
+        # /profile [секунд] - профилирование работающего процесса без рестарта;
+        # обработчик просто ждет, остальные обновления обрабатываются как обычно
+        if message.from_user.id not in BotHandlers.ADMINS:
+            await message.answer("❌ Доступ запрещен")
+            return
+        parts = message.text.split()
+        try:
+            seconds = int(parts[1]) if len(parts) > 1 else 30
+            if not 0 < seconds <= BotHandlers.PROFILE_MAX_SECONDS:
+                raise ValueError
+        except ValueError:
+            await message.answer(f"❗ Используй: /profile [1-{BotHandlers.PROFILE_MAX_SECONDS} секунд]")
+            return
+        if self._profiling:
+            await message.answer("Профилирование уже идет")
+            return
+        self._profiling = True
+        try:
+            await message.answer(f"🔬 Профилирую {seconds} с…")
+            collapsed, summary = await profile_loop(seconds)
+        finally:
+            self._profiling = False
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        await message.answer_document(BufferedInputFile(collapsed.encode(), filename=f"profile-{stamp}.collapsed"))
+        await message.answer_document(BufferedInputFile(summary.encode(), filename=f"profile-{stamp}.txt"))
 
     async def handle_page_callback(self, callback: types.CallbackQuery):
-        data = callback.data.split(":")
+        data = callback.data.split(sep=":", maxsplit=3)
         page = int(data[1])
         is_admin = data[2] == "admin"
+        after = before = None
+        if len(data) > 3 and data[3]:
+            created_at, _, request_id = data[3][1:].rpartition("|")
+            cursor = (created_at, int(request_id))
+            if data[3][0] == "a":
+                after = cursor
+            else:
+                before = cursor
 
         if is_admin:
-            await self.show_all_requests(callback.message, page, user_id=callback.from_user.id)
+            await self.show_all_requests(callback.message, page, user_id=callback.from_user.id,
+                                         after=after, before=before, edit=True)
         else:
-            await self.show_user_requests(callback.message, page, user_id=callback.from_user.id)
+            await self.show_user_requests(callback.message, page, user_id=callback.from_user.id,
+                                          after=after, before=before, edit=True)
         await callback.answer()
 
+    @staticmethod
+    async def drop_request_buttons(message: types.Message, *request_ids: int):
+        # Убирает из клавиатуры только кнопки обработанных заявок, остальная страница остается.
+        # Кнопка "все на странице" после любой массовой смены статуса больше не нужна
+        ids = {str(request_id) for request_id in request_ids}
+
+        def belongs(button):
+            parts = (button.callback_data or "").split(":")
+            if parts[0] == "bulk":
+                return len(ids) > 1
+            return parts[0] in ("status", "cancel") and len(parts) > 1 and parts[1] in ids
+
+        markup = message.reply_markup
+        rows = []
+        if markup:
+            for row in markup.inline_keyboard:
+                row = [b for b in row if not belongs(b)]
+                if row:
+                    rows.append(row)
+        try:
+            await message.edit_reply_markup(
+                reply_markup=types.InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
+            )
+        except exceptions.TelegramBadRequest:
+            pass
+
     async def cancel_request(self, callback: types.CallbackQuery):
         await callback.answer()
         parts = callback.data.split(sep=":", maxsplit=1)
@@ -387,10 +548,7 @@ class BotHandlers:
             await callback.answer("Ошибка при работе с БД", show_alert=False)
             return
         if deleted:
-            try:
-                await callback.message.edit_reply_markup(reply_markup=None)
-            except exceptions.TelegramBadRequest:
-                pass
+            await self.drop_request_buttons(callback.message, request_id)
         else:
             await callback.answer("Заявка не найдена или уже удалена", show_alert=False)
 
@@ -411,9 +569,57 @@ class BotHandlers:
             await callback.answer("Ошибка при работе с БД", show_alert=False)
             return
         if updated:
-            try:
-                await callback.message.edit_reply_markup(reply_markup=None)
-            except exceptions.TelegramBadRequest:
-                pass
+            await self.drop_request_buttons(callback.message, request_id)
         else:
             await callback.answer("Заявка не найдена", show_alert=False)
+
+    async def notify_status_changed(self, changed, status: str):
+        # Одно уведомление на пользователя, сколько бы его заявок ни поменялось
+        by_user = {}
+        for row in changed:
+            by_user.setdefault(row["user_id"], []).append(row["id"])
+        for user_id, request_ids in by_user.items():
+            shown = ", ".join(f"#{request_id}" for request_id in request_ids[:BotHandlers.NOTIFY_IDS_LIMIT])
+            rest = len(request_ids) - BotHandlers.NOTIFY_IDS_LIMIT
+            if rest > 0:
+                shown += f" и еще {rest}"
+            await self.notifier.send(user_id, f"🔔 Статус заявок {shown} изменен: {self.status_display(status)}")
+
+    async def bulk_status_page(self, callback: types.CallbackQuery):
+        if callback.from_user.id not in BotHandlers.ADMINS:
+            await callback.answer("❌ Доступ запрещен")
+            return
+        try:
+            request_ids = [int(part) for part in callback.data.split(":", 1)[1].split(",")]
+        except ValueError:
+            await callback.answer("Неверный id заявки", show_alert=False)
+            return
+        try:
+            changed = await Database.bulk_update_status(request_ids, BULK_STATUS)
+        except Exception:
+            await callback.answer("Ошибка при работе с БД", show_alert=False)
+            return
+        await callback.answer(f"Обновлено заявок: {len(changed)}")
+        await self.drop_request_buttons(callback.message, *request_ids)
+        await self.notify_status_changed(changed, BULK_STATUS)
+
+    async def bulk_status_older(self, message: types.Message):
+        # /done_older <дней> - закрыть все открытые заявки старше N дней
+        if message.from_user.id not in BotHandlers.ADMINS:
+            await message.answer("❌ Доступ запрещен")
+            return
+        parts = message.text.split()
+        try:
+            days = int(parts[1])
+            if days < 0:
+                raise ValueError
+        except (IndexError, ValueError):
+            await message.answer("❗ Используй: /done_older <дней>")
+            return
+        try:
+            changed = await Database.bulk_update_status_older(days, BULK_STATUS)
+        except Exception:
+            await message.answer("Ошибка при работе с БД")
+            return
+        await message.answer(f"✅ Обновлено заявок старше {days} дн.: {len(changed)}")
+        await self.notify_status_changed(changed, BULK_STATUS)
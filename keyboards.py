@@ -0,0 +1,81 @@
+from aiogram.types import (
+    InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup,
+)
+from rates import CITIES
+
+# Кнопки смены статуса заявки: (текст, статус)
+STATUS_ACTIONS = (
+    ("✅ В работе", "в работе"),
+    ("✅ Выполнено", "выполнена"),
+    ("❌ Отменить", "отменена"),
+)
+REMIND_MINUTES = (1, 5, 10, 30)
+# Статус, в который переводит кнопка "все на странице" и команда /done_older
+BULK_STATUS = "выполнена"
+
+
+def _pairs(buttons):
+    return [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+
+
+class Keyboards:
+    # Статические клавиатуры собираются один раз при старте, а не в каждом обработчике
+
+    def __init__(self):
+        menu = [
+            [KeyboardButton(text="Курс валют"), KeyboardButton(text="⏱ Время")],
+            [KeyboardButton(text="🔔 Напоминание"), KeyboardButton(text="📍 Отправить локацию", request_location=True)],
+            [KeyboardButton(text="➕ Создать заявку"), KeyboardButton(text="📄 Мои заявки")]
+        ]
+        self.user_menu = ReplyKeyboardMarkup(keyboard=menu, resize_keyboard=True)
+        self.admin_menu = ReplyKeyboardMarkup(
+            keyboard=[*menu, [KeyboardButton(text="📋 Все заявки"), KeyboardButton(text="🔎 Поиск заявок")]],
+            resize_keyboard=True
+        )
+        self.register = ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text="📝 Зарегистрироваться", request_contact=False)]],
+            resize_keyboard=True,
+            one_time_keyboard=True
+        )
+        self.send_contact = ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text="Отправить контакт", request_contact=True)]],
+            resize_keyboard=True,
+            one_time_keyboard=True
+        )
+        self.cancel_request = ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text="Отменить")]],
+            resize_keyboard=True,
+            one_time_keyboard=True
+        )
+        self.cities = InlineKeyboardMarkup(inline_keyboard=_pairs(
+            [InlineKeyboardButton(text=city, callback_data=f"city:{city}") for city in CITIES]
+        ))
+        self.remind = InlineKeyboardMarkup(inline_keyboard=_pairs(
+            [InlineKeyboardButton(text=f"{m} мин", callback_data=f"rem_time:{m}") for m in REMIND_MINUTES]
+            + [InlineKeyboardButton(text="Свой интервал ⌨️", callback_data="rem_custom")]
+        ))
+
+    def main_menu(self, is_admin: bool) -> ReplyKeyboardMarkup:
+        return self.admin_menu if is_admin else self.user_menu
+
+    @staticmethod
+    def status_buttons(request_id: int, numbered: bool = False) -> list:
+        # Ряд кнопок статуса для заявки по шаблону STATUS_ACTIONS; numbered - с номером заявки в тексте.
+        # Без кэша: каждая заявка собирается почти всегда один раз, страницы целиком кэширует PageCache
+        suffix = f" #{request_id}" if numbered else ""
+        return [
+            InlineKeyboardButton(text=text + suffix, callback_data=f"status:{request_id}:{status}")
+            for text, status in STATUS_ACTIONS
+        ]
+
+    @staticmethod
+    def status_keyboard(request_id: int) -> InlineKeyboardMarkup:
+        return InlineKeyboardMarkup(inline_keyboard=[Keyboards.status_buttons(request_id)])
+
+    @staticmethod
+    def bulk_status_button(request_ids: tuple) -> InlineKeyboardButton:
+        # id всех заявок страницы в одной callback_data: bulk:<id>,<id>,...
+        return InlineKeyboardButton(
+            text="✅ Выполнить все на странице",
+            callback_data="bulk:" + ",".join(map(str, request_ids))
+        )
@@ -0,0 +1,149 @@
+import asyncio
+import functools
+import inspect
+import logging
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+# Границы корзин гистограмм в секундах
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        # Оценка по верхней границе корзины, для сводки в логах этого достаточно
+        target = q * self.count
+        seen = 0
+        for i, bound in enumerate(BUCKETS):
+            seen += self.counts[i]
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    # Гистограммы задержек по обработчикам, запросам к БД, методам Bot API и опозданий
+    # напоминаний, число обновлений в обработке и счетчики кэшей. Отдаются в текстовом формате Prometheus.
+
+    def __init__(self):
+        self.histograms = {
+            "bot_handler_seconds": {},
+            "bot_db_query_seconds": {},
+            "bot_telegram_api_seconds": {},
+            # Опоздание доставки напоминаний относительно due_at
+            "bot_reminder_drift_seconds": {},
+        }
+        self.in_flight = 0
+        # Кэши: имя -> функция, возвращающая {"size", "hits", "misses"} (TTLCache.stats)
+        self.caches = {}
+
+    def register_cache(self, name: str, stats):
+        self.caches[name] = stats
+
+    def observe(self, metric: str, name: str, value: float):
+        histograms = self.histograms[metric]
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def render(self) -> str:
+        lines = [
+            "# TYPE bot_updates_in_flight gauge",
+            f"bot_updates_in_flight {self.in_flight}",
+        ]
+        for metric, histograms in self.histograms.items():
+            lines.append(f"# TYPE {metric} histogram")
+            for name, histogram in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{name="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{name="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric}_sum{{name="{name}"}} {histogram.sum}')
+                lines.append(f'{metric}_count{{name="{name}"}} {histogram.count}')
+        cache_stats = {name: stats() for name, stats in sorted(self.caches.items())}
+        for metric, key, kind in (("bot_cache_size", "size", "gauge"), ("bot_cache_hits_total", "hits", "counter"),
+                                  ("bot_cache_misses_total", "misses", "counter")):
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, stats in cache_stats.items():
+                lines.append(f'{metric}{{name="{name}"}} {stats[key]}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        parts = [f"в обработке: {self.in_flight}"]
+        for metric, histograms in self.histograms.items():
+            for name, h in sorted(histograms.items(), key=lambda item: -item[1].sum)[:5]:
+                parts.append(
+                    f"{metric}[{name}] n={h.count} avg={h.sum / h.count * 1000:.1f}мс p99<={h.quantile(0.99) * 1000:.0f}мс"
+                )
+        for name, stats in sorted(self.caches.items()):
+            stats = stats()
+            lookups = stats["hits"] + stats["misses"]
+            hit_rate = f"{stats['hits'] / lookups:.0%}" if lookups else "-"
+            parts.append(f"кэш[{name}] size={stats['size']} hit={hit_rate}")
+        return "; ".join(parts)
+
+    async def handle_metrics(self, request: "web.Request") -> "web.Response":
+        # aiohttp.web грузится при первом запросе /metrics, а не при импорте: он заметно удлиняет старт
+        from aiohttp import web
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+    async def log_summary_loop(self, interval: float = 60):
+        while True:
+            await asyncio.sleep(interval)
+            logging.info("Метрики: %s", self.summary())
+
+    async def start_server(self, host: str, port: int) -> "web.AppRunner":
+        from aiohttp import web
+        # Отдельный /metrics для режима polling; в webhook-режиме маршрут добавляется в приложение бота
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+metrics = Metrics()
+
+
+def instrument_database(db_cls):
+    # Оборачивает публичные async-методы Database замером времени
+    for name, attr in list(vars(db_cls).items()):
+        if name.startswith("_") or not isinstance(attr, classmethod):
+            continue
+        func = attr.__func__
+        if not inspect.iscoroutinefunction(func) or getattr(func, "__instrumented__", False):
+            continue
+
+        def wrap(func, name):
+            @functools.wraps(func)
+            async def wrapper(cls, *args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(cls, *args, **kwargs)
+                finally:
+                    metrics.observe("bot_db_query_seconds", name, time.perf_counter() - started)
+            wrapper.__instrumented__ = True
+            return wrapper
+
+        setattr(db_cls, name, classmethod(wrap(func, name)))
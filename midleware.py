@@ -1,13 +1,125 @@
+import time
 from aiogram import BaseMiddleware
 from aiogram import types
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from database import Database
+from metrics import metrics
+
+# Лимиты анти-флуда: имя обработчика -> (действий в секунду, допустимый всплеск)
+THROTTLE_LIMITS = {
+    "handle_city_selected": (0.5, 3),
+    "handle_page_callback": (2, 5),
+    "show_user_requests": (0.5, 3),
+    "save_request": (0.2, 3),
+    "export_cmd": (1 / 60, 1),
+}
+# Дорогие действия ограничиваются для всех, exempt (админы) на них не действует
+STRICT_THROTTLE = {"export_cmd"}
 
 
 class RegistrationMiddleware(BaseMiddleware):
     async def __call__(self, handler, event, data):
         if isinstance(event, types.Message):
-            if event.text in ("/reg", "/start", "📝 Зарегистрироваться"):
+            text = event.text or ""
+            if text == "📝 Зарегистрироваться":
+                return await handler(event, data)
+            # Команда разбирается как в DispatchTable: пропускаются и "/start <payload>" (диплинк), и "/start@bot"
+            if text.startswith("/") and text.split(maxsplit=1)[0].split("@", 1)[0] in ("/reg", "/start"):
                 return await handler(event, data)
             if event.content_type == "contact":
                 return await handler(event, data)
+            # Проверка идет почти всегда из кэша Database, без запроса в БД
+            if event.from_user and not await Database.is_registered(event.from_user.id):
+                await event.answer("Сначала зарегистрируйся: /start")
+                return
 
         return await handler(event, data)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    # Анти-флуд по паре (пользователь, действие), действие - обработчик, выбранный DispatchTable.
+    # Токен-бакет хранится кортежем (токены, время) в одном dict; порядок ключей - от давно
+    # не активных к свежим, поэтому сверх max_keys вытесняются самые давние, а раз в
+    # sweep_interval выметаются полные ведра - они ничем не отличаются от отсутствующих
+    def __init__(self, limits: dict = None, default: tuple = (3, 10), max_keys: int = 100_000,
+                 sweep_interval: float = 60, exempt=None):
+        self.limits = {**THROTTLE_LIMITS, **(limits or {})}
+        self.default = default
+        # exempt(user_id) -> True, если пользователя не ограничиваем (админы)
+        self.exempt = exempt
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+        self._buckets = {}
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def allow(self, user_id: int, action: str) -> bool:
+        rate, burst = self.limits.get(action, self.default)
+        now = time.monotonic()
+        key = (user_id, action)
+        state = self._buckets.pop(key, None)
+        tokens = burst if state is None else min(burst, state[0] + (now - state[1]) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            del self._buckets[next(iter(self._buckets))]
+        if now >= self._next_sweep:
+            self._sweep(now)
+        return allowed
+
+    def _sweep(self, now: float):
+        self._next_sweep = now + self.sweep_interval
+        buckets = {}
+        for key, (tokens, updated) in self._buckets.items():
+            rate, burst = self.limits.get(key[1], self.default)
+            if tokens + (now - updated) * rate < burst:
+                buckets[key] = (tokens, updated)
+        self._buckets = buckets
+
+    async def __call__(self, handler, event, data):
+        target = data.get("target")
+        user = data.get("event_from_user")
+        if target is None or user is None:
+            return await handler(event, data)
+        action = target.__name__
+        if (self.exempt and action not in STRICT_THROTTLE and self.exempt(user.id)) or self.allow(user.id, action):
+            return await handler(event, data)
+        # Лишнее отбрасывается до БД и сети, но пользователь узнает об этом: на callback отвечаем,
+        # чтобы у кнопки пропали часики, на сообщение - текстом. Состояние FSM не меняется,
+        # так что, например, текст заявки можно просто отправить еще раз
+        if isinstance(event, types.CallbackQuery):
+            await event.answer("⏳ Не так часто")
+        elif isinstance(event, types.Message):
+            await event.answer("⏳ Не так часто, отправь еще раз чуть позже")
+
+
+class InstrumentationMiddleware(BaseMiddleware):
+    # Время работы каждого обработчика и число обновлений в обработке
+    async def __call__(self, handler, event, data):
+        # Через DispatchTable настоящий обработчик лежит в data["target"]
+        target = data.get("target")
+        handler_object = data.get("handler")
+        if target is not None:
+            name = target.__name__
+        elif handler_object is not None:
+            name = handler_object.callback.__name__
+        else:
+            name = type(event).__name__
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.in_flight -= 1
+            metrics.observe("bot_handler_seconds", name, time.perf_counter() - started)
+
+
+class ApiTimingMiddleware(BaseRequestMiddleware):
+    # Время вызовов Bot API по методам, вешается на bot.session
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            metrics.observe("bot_telegram_api_seconds", type(method).__name__, time.perf_counter() - started)
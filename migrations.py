@@ -0,0 +1,129 @@
+# Версионированные миграции схемы. Текущая версия хранится в PRAGMA user_version,
+# Database.init_db применяет по порядку все миграции с номером больше текущего.
+# Уже выпущенные миграции не редактируем - только добавляем новые в конец.
+
+MIGRATIONS = [
+    (1, [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            first_name TEXT,
+            last_name TEXT,
+            phone_number TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            text TEXT,
+            status TEXT DEFAULT 'новая',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    # Индексы под списки заявок: порядок сортировки берется из индекса,
+    # status проверяется по индексу без чтения строки
+    (2, [
+        """
+        CREATE INDEX IF NOT EXISTS idx_requests_user_created
+        ON requests (user_id, created_at, id, status)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_requests_created
+        ON requests (created_at, id, status)
+        """,
+    ]),
+    # Напоминания: due_at - unix-время срабатывания, частичный индекс только по ожидающим
+    (3, [
+        """
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            text TEXT,
+            due_at REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending'
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_reminders_pending_due
+        ON reminders (due_at) WHERE status = 'pending'
+        """,
+    ]),
+    # FSM-хранилище aiogram: состояние и данные диалога в компактном JSON, expires_at для очистки брошенных
+    (4, [
+        """
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_fsm_storage_expires
+        ON fsm_storage (expires_at)
+        """,
+    ]),
+    # Полнотекстовый поиск по тексту заявок: внешний content-индекс FTS5, синхронизируется триггерами
+    (5, [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS requests_fts USING fts5(
+            text, content='requests', content_rowid='id'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS requests_fts_insert AFTER INSERT ON requests BEGIN
+            INSERT INTO requests_fts (rowid, text) VALUES (new.id, new.text);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS requests_fts_delete AFTER DELETE ON requests BEGIN
+            INSERT INTO requests_fts (requests_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS requests_fts_update AFTER UPDATE OF text ON requests BEGIN
+            INSERT INTO requests_fts (requests_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            INSERT INTO requests_fts (rowid, text) VALUES (new.id, new.text);
+        END
+        """,
+        "INSERT INTO requests_fts (requests_fts) VALUES ('rebuild')",
+    ]),
+    # Архив закрытых заявок: задача хранения переносит сюда старые выполненные и отмененные,
+    # чтобы горячая таблица requests и ее индексы не росли бесконечно
+    (6, [
+        """
+        CREATE TABLE IF NOT EXISTS requests_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            text TEXT,
+            status TEXT NOT NULL,
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_requests_archive_user_created
+        ON requests_archive (user_id, created_at, id)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_requests_archive_created
+        ON requests_archive (created_at, id)
+        """,
+    ]),
+    # Фактическое время доставки напоминания: по разнице с due_at видно, насколько рассылка опаздывает
+    (7, [
+        "ALTER TABLE reminders ADD COLUMN delivered_at REAL",
+    ]),
+    # Планировщик захватывает напоминания статусом 'sending' до отправки; после падения
+    # процесса их находят по этому индексу, он почти всегда пуст
+    (8, [
+        """
+        CREATE INDEX IF NOT EXISTS idx_reminders_sending
+        ON reminders (id) WHERE status = 'sending'
+        """,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
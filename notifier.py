@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import logging
+import time
+from collections import deque
+from typing import Optional
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        # Забирает токен и возвращает 0, либо сколько ждать до следующего токена
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        while True:
+            wait = self.delay()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class Notifier:
+    # Очередь исходящих сообщений с пулом воркеров. Лимиты по умолчанию -
+    # лимиты Telegram: около 30 сообщений в секунду на бота и 1 в секунду в один чат.
+    # У каждого чата своя очередь; чат попадает в общую очередь готовых, только когда
+    # его ведро разрешает отправку, иначе ждет в куче таймеров. Так воркер никогда не спит
+    # на лимите одного чата, пока другие чаты ждут. На TelegramRetryAfter сообщение
+    # возвращается в голову очереди чата, а чат откладывается на retry_after.
+
+    def __init__(self, bot: Bot, workers: int = 4, global_rate: float = 30, chat_rate: float = 1,
+                 max_retries: int = 3, queue_size: int = 10000, max_chat_buckets: int = 10000):
+        self.bot = bot
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self.max_chat_buckets = max_chat_buckets
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = {}
+        # chat_id -> deque[(text, kwargs, future, attempt)]; чат есть в словаре, пока он
+        # стоит в _ready, в _timers или его сообщение отправляет воркер - ровно в одном месте
+        self._pending = {}
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._timers = []  # куча (ready_at, seq, chat_id)
+        self._timer_seq = 0
+        self._timer_wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(queue_size)
+        self._count = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = []
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._timer_loop()))
+
+    async def stop(self, drain: bool = True, timeout: float = 10):
+        if drain and self._count:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logging.warning("Notifier: за %s с не доставлено %d сообщений, они отброшены", timeout, self._count)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Ждущим submit отдается отмена: сообщение не отправлено
+        for queue in self._pending.values():
+            for item in queue:
+                self._finish(item, None, cancel=True)
+        self._pending.clear()
+        self._timers.clear()
+        self._ready = asyncio.Queue()
+
+    async def send(self, chat_id: int, text: str, **kwargs):
+        # Ставит сообщение в очередь и сразу возвращается, ждет только если очередь переполнена
+        await self._put(chat_id, (text, kwargs, None, 0))
+
+    async def submit(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        # Как send, но возвращает future с итогом доставки: None или исключение последней попытки.
+        # Future отменяется, если сообщение так и не было отправлено до stop()
+        future = asyncio.get_running_loop().create_future()
+        await self._put(chat_id, (text, kwargs, future, 0))
+        return future
+
+    async def _put(self, chat_id: int, item: tuple):
+        await self._slots.acquire()
+        self._count += 1
+        self._idle.clear()
+        queue = self._pending.get(chat_id)
+        if queue is not None:
+            queue.append(item)
+            return
+        self._pending[chat_id] = deque((item,))
+        self._schedule(chat_id)
+
+    def _finish(self, item: tuple, error: Optional[Exception], cancel: bool = False):
+        _, _, future, _ = item
+        if future is not None and not future.done():
+            if cancel:
+                future.cancel()
+            else:
+                future.set_result(error)
+        self._slots.release()
+        self._count -= 1
+        if not self._count:
+            self._idle.set()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_chat_buckets:
+                # Полные ведра ничем не отличаются от новых, их можно выбросить
+                self._chat_buckets = {k: b for k, b in self._chat_buckets.items() if not b.is_full()}
+            bucket = TokenBucket(self.chat_rate, 1)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _schedule(self, chat_id: int, delay: float = 0):
+        # Чат с непустой очередью: в готовые, если ведро чата дает токен, иначе - в кучу таймеров
+        if not delay:
+            delay = self._chat_bucket(chat_id).delay()
+        if not delay:
+            self._ready.put_nowait(chat_id)
+            return
+        self._timer_seq += 1
+        heapq.heappush(self._timers, (time.monotonic() + delay, self._timer_seq, chat_id))
+        if self._timers[0][1] == self._timer_seq:
+            self._timer_wakeup.set()
+
+    async def _timer_loop(self):
+        while True:
+            if not self._timers:
+                await self._timer_wakeup.wait()
+                self._timer_wakeup.clear()
+                continue
+            wait = self._timers[0][0] - time.monotonic()
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(self._timer_wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                self._timer_wakeup.clear()
+                continue
+            _, _, chat_id = heapq.heappop(self._timers)
+            # Ведро проверяется заново: после retry_after токена может еще не быть
+            self._schedule(chat_id)
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            queue = self._pending[chat_id]
+            item = queue.popleft()
+            text, kwargs, future, attempt = item
+            try:
+                error = None
+                if future is None or not future.cancelled():
+                    await self._global_bucket.acquire()
+                    try:
+                        await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                    except TelegramRetryAfter as e:
+                        if attempt < self.max_retries:
+                            queue.appendleft((text, kwargs, future, attempt + 1))
+                            self._schedule(chat_id, e.retry_after)
+                            continue
+                        error = e
+                    except Exception as e:
+                        error = e
+            except asyncio.CancelledError:
+                self._finish(item, None, cancel=True)
+                raise
+            self._finish(item, error)
+            if future is None and error is not None:
+                logging.warning("Не удалось отправить сообщение в чат %s: %s", chat_id, error)
+            if queue:
+                self._schedule(chat_id)
+            else:
+                del self._pending[chat_id]
@@ -0,0 +1,160 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+# Импортируется первым в run.py и ничего тяжелого сам не тянет, чтобы мерить все остальное
+
+
+class StartupProfiler:
+    # Время запуска по фазам: mark() закрывает фазу, начатую предыдущей отметкой,
+    # phase() мерит блок кода целиком
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = []
+
+    def mark(self, name: str):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._last = time.perf_counter()
+            self.phases.append((name, self._last - started))
+
+    def report(self) -> str:
+        total = time.perf_counter() - self.started
+        lines = [f"{name:<32} {seconds * 1000:9.1f} мс" for name, seconds in self.phases]
+        lines.append(f"{'всего с начала импорта run.py':<32} {total * 1000:9.1f} мс")
+        return "\n".join(lines)
+
+
+class SlowCallbackCollector(logging.Handler):
+    # Ловит предупреждения asyncio "Executing <...> took N seconds", которые пишет цикл в debug-режиме
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.records = []
+
+    def emit(self, record: logging.LogRecord):
+        if str(record.msg).startswith("Executing"):
+            self.records.append(record.getMessage())
+
+
+class SamplingProfiler:
+    # Сэмплирующий профайлер без зависимостей: отдельный поток раз в interval снимает стеки
+    # всех потоков процесса (цикл событий, потоки aiosqlite) и считает одинаковые стеки.
+    # Результат - collapsed stacks ("поток;внешний;...;внутренний N") для flamegraph.pl/speedscope
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, n: int, inclusive: bool = False) -> list:
+        # (функция, сэмплы): собственное время - по верхнему кадру, включающее - по всем кадрам стека
+        counts = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if inclusive:
+                for name in set(frames):
+                    counts[name] += count
+            elif frames:
+                counts[frames[-1]] += count
+        return counts.most_common(n)
+
+
+async def profile_loop(seconds: float, top: int = 20, interval: float = 0.005,
+                       slow_callback_duration: float = 0.1) -> tuple:
+    # Профилирует работающий процесс seconds секунд: сэмплы стеков, медленные callback-и цикла
+    # и время обработчиков из metrics за тот же период. Возвращает (collapsed stacks, сводка).
+    # asyncio и metrics импортируются здесь: модуль грузится первым и должен оставаться легким
+    import asyncio
+    from metrics import metrics
+
+    loop = asyncio.get_running_loop()
+    debug, slow_duration = loop.get_debug(), loop.slow_callback_duration
+    collector = SlowCallbackCollector()
+    asyncio_logger = logging.getLogger("asyncio")
+    handlers_before = {
+        name: (h.count, h.sum) for name, h in metrics.histograms["bot_handler_seconds"].items()
+    }
+    sampler = SamplingProfiler(interval)
+    asyncio_logger.addHandler(collector)
+    loop.slow_callback_duration = slow_callback_duration
+    loop.set_debug(True)
+    sampler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.stop()
+        loop.set_debug(debug)
+        loop.slow_callback_duration = slow_duration
+        asyncio_logger.removeHandler(collector)
+
+    lines = [f"Профиль за {seconds:g} с: {sampler.samples} сэмплов, интервал {interval * 1000:g} мс", ""]
+    handler_times = []
+    for name, h in metrics.histograms["bot_handler_seconds"].items():
+        count, total = handlers_before.get(name, (0, 0.0))
+        if h.count > count:
+            handler_times.append((h.sum - total, h.count - count, name))
+    lines.append("Обработчики (время от входа до выхода):")
+    for total, count, name in sorted(handler_times, reverse=True)[:top]:
+        lines.append(f"  {name:<32} n={count:<6} всего {total * 1000:9.1f} мс  среднее {total / count * 1000:7.1f} мс")
+    lines.append("")
+    lines.append(f"Медленные callback-и цикла (> {slow_callback_duration * 1000:g} мс): {len(collector.records)}")
+    lines.extend(f"  {record[:300]}" for record in collector.records[:top])
+    total_samples = sum(sampler.stacks.values()) or 1
+    for title, inclusive in (("собственное", False), ("включающее", True)):
+        lines.append("")
+        lines.append(f"Топ-{top} функций, {title} время (сэмплы по всем потокам):")
+        for name, count in sampler.top(top, inclusive):
+            lines.append(f"  {count:7d} {count / total_samples * 100:5.1f}%  {name}")
+    return sampler.collapsed(), "\n".join(lines) + "\n"
+
+
+startup_profiler = StartupProfiler()
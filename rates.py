@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+import aiohttp
+
+CITIES = ("Минск", "Брест", "Гродно", "Гомель", "Витебск", "Могилев")
+
+
+class RatesClient:
+    # Клиент курсов валют: одна сессия на процесс и один запрос наверх на город
+    # при одновременных нажатиях (single-flight). Кэшем служит снимок RatesRefresher.
+
+    def __init__(self, url: str, timeout: float = 5):
+        self.url = url
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._inflight = {}  # city -> asyncio.Task
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300),
+            )
+        return self._session
+
+    async def close(self):
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def fetch(self, city: str):
+        # asyncio.shield: отмена одного ждущего не отменяет запрос для остальных
+        return await asyncio.shield(self._refresh(city))
+
+    def _refresh(self, city: str) -> asyncio.Task:
+        task = self._inflight.get(city)
+        if task is None:
+            task = asyncio.create_task(self._fetch(city))
+            self._inflight[city] = task
+            task.add_done_callback(lambda t: self._on_done(city, t))
+        return task
+
+    def _on_done(self, city: str, task: asyncio.Task):
+        # Ошибку логирует RatesRefresher.refresh_city, который ждет этот запрос
+        self._inflight.pop(city, None)
+
+    async def _fetch(self, city: str):
+        async with self._get_session().get(self.url, params={"city": city}) as resp:
+            resp.raise_for_status()
+            return await resp.json(content_type=None)
+
+
+def parse_rates(data) -> Optional[tuple]:
+    # (usd_in, usd_out, rub_in, rub_out, cny_in, cny_out) первого отделения из ответа API
+    if not data:
+        return None
+    branch = data[0]
+    return (
+        float(branch["USD_in"]),
+        float(branch["USD_out"]),
+        float(branch["RUB_in"]) / 100,
+        float(branch["RUB_out"]) / 100,
+        float(branch["CNY_in"]) / 10,
+        float(branch["CNY_out"]) / 10,
+    )
+
+
+def render_rates(city: str, rates: tuple) -> str:
+    usd_in, usd_out, rub_in, rub_out, cny_in, cny_out = rates
+    return (
+        f"*Курс валют в {city}:*\n"
+        f"💵 USD: {usd_in:.4f}/{usd_out:.4f}\n"
+        f"🇷🇺 RUB: {rub_in:.4f}/{rub_out:.4f}\n"
+        f"🇨🇳 CNY: {cny_in:.4f}/{cny_out:.4f}"
+    )
+
+
+class RatesRefresher:
+    # Фоновое обновление курсов по всем городам из CITIES. Снимок хранит для города
+    # разобранные курсы, готовый Markdown-ответ и время обновления, так что
+    # нажатие на город - это просто чтение из памяти.
+
+    def __init__(self, client: RatesClient, cities=CITIES, interval: float = 300, concurrency: int = 3):
+        self.client = client
+        self.cities = cities
+        self.interval = interval
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._snapshot = {}  # city -> (rates, text, updated_at)
+        self._task: Optional[asyncio.Task] = None
+
+    async def get_text(self, city: str) -> Optional[str]:
+        # С фоновым обновлением - всегда из снимка. Без него (webhook-воркеры, кроме первого)
+        # город старше interval обновляется по запросу; если наверх сходить не удалось,
+        # отдается старый текст
+        entry = self._snapshot.get(city)
+        if entry and (self._task is not None or time.time() - entry[2] < self.interval):
+            return entry[1]
+        return await self.refresh_city(city) or (entry[1] if entry else None)
+
+    def age(self) -> Optional[float]:
+        # Возраст самого старого города в снимке, None - снимок еще пуст
+        if not self._snapshot:
+            return None
+        return time.time() - min(entry[2] for entry in self._snapshot.values())
+
+    async def refresh_city(self, city: str) -> Optional[str]:
+        async with self._semaphore:
+            try:
+                rates = parse_rates(await self.client.fetch(city))
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, TypeError) as e:
+                logging.warning("Не удалось обновить курсы для %s: %s", city, e)
+                return None
+        if rates is None:
+            return None
+        text = render_rates(city, rates)
+        self._snapshot[city] = (rates, text, time.time())
+        return text
+
+    async def refresh(self):
+        await asyncio.gather(*(self.refresh_city(city) for city in self.cities))
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            age = self.age()
+            if age is None or age > self.interval * 3:
+                logging.warning("Курсы валют устарели: возраст снимка %s с", age)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from database import Database
+
+
+class RetentionJob:
+    # Раз в interval секунд переносит выполненные и отмененные заявки старше max_age_days в архив.
+    # Пачки по batch_size строк с паузой между ними, чтобы не держать блокировку записи долго
+    # и не задерживать записи пользователей; после переноса - incremental_vacuum и PRAGMA optimize.
+
+    def __init__(self, max_age_days: int = 30, interval: float = 3600, batch_size: int = 500,
+                 pause: float = 0.05, vacuum_pages: int = 1000):
+        self.max_age_days = max_age_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_once(self) -> int:
+        # created_at пишется через CURRENT_TIMESTAMP, то есть в UTC
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.max_age_days)
+        cutoff = cutoff.strftime("%Y-%m-%d %H:%M:%S")
+        moved = 0
+        while True:
+            count = await Database.archive_requests_batch(cutoff, self.batch_size)
+            moved += count
+            if count < self.batch_size:
+                break
+            await asyncio.sleep(self.pause)
+        if moved:
+            await Database.vacuum_incremental(self.vacuum_pages)
+            logging.info("Перенесено в архив заявок: %s", moved)
+        await Database.optimize()
+        return moved
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Ошибка при переносе заявок в архив")
+            await asyncio.sleep(self.interval)
@@ -1,33 +1,191 @@
+from profiling import startup_profiler
+import argparse
 import asyncio
+import logging
+import multiprocessing
 import os
+from typing import Optional
 from dotenv import load_dotenv
+startup_profiler.mark("импорт stdlib и dotenv")
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+startup_profiler.mark("импорт aiogram")
 from database import Database
 from handlers import BotHandlers
+from scheduler import ReminderScheduler
+from retention import RetentionJob
+from notifier import Notifier
+from storage import SQLiteStorage
+from metrics import metrics, instrument_database
+from midleware import ApiTimingMiddleware
+startup_profiler.mark("импорт модулей бота")
 
 load_dotenv()
 TOKEN = os.getenv("TG_API_KEY")
 DB_PATH = os.getenv("DB_PATH") or "bot.db"
 URL = os.getenv("URL")
+# Group commit записей в БД, 0 - коммит на каждую запись
+DB_GROUP_COMMIT_MS = int(os.getenv("DB_GROUP_COMMIT_MS") or 0)
+# Количество read-only соединений для чтения, 0 - все через одно соединение
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE") or os.cpu_count() or 0)
+# Webhook: публичный https-адрес бота (без пути); если не задан, setWebhook не вызывается
+WEBHOOK_BASE = os.getenv("WEBHOOK_BASE")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH") or "/webhook"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST") or "0.0.0.0"
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT") or 8080)
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS") or 1)
+# Кэш готовых страниц списков заявок, 0 - выключен. Инвалидация идет внутри процесса,
+# поэтому при нескольких webhook-воркерах кэш выключается: записи других процессов он не увидит
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE") or 2000)
+# /metrics в режиме polling поднимается отдельным сервером, если задан порт
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL") or 60)
+# Проверка планов запросов при старте; в проде с неизменной схемой можно выключить ради быстрого рестарта
+DB_CHECK_PLANS = (os.getenv("DB_CHECK_PLANS") or "1") != "0"
+# Перенос закрытых заявок старше RETENTION_DAYS дней в архив, 0 - не переносить
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS") or 30)
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL") or 3600)
+
+instrument_database(Database)
+startup_profiler.mark("окружение и инструментирование")
+
+
+def create_dispatcher(bot: Bot, run_scheduler: bool = True, metrics_server: bool = False,
+                      notifier: Optional[Notifier] = None, page_cache_size: int = PAGE_CACHE_SIZE,
+                      fsm_cache: bool = True, prefetch_rates: bool = True) -> Dispatcher:
+    bot.session.middleware(ApiTimingMiddleware())
+    # fsm_cache=False - без кэша и отложенной записи, чтобы диалог был виден всем воркерам
+    storage = SQLiteStorage() if fsm_cache else SQLiteStorage(cache_ttl=0, flush_interval=0)
+    dp = Dispatcher(storage=storage)
+    notifier = notifier or Notifier(bot)
+    scheduler = ReminderScheduler(notifier)
+    retention = RetentionJob(RETENTION_DAYS, RETENTION_INTERVAL)
+    handlers = BotHandlers(url=URL, scheduler=scheduler, notifier=notifier, page_cache_size=page_cache_size)
+    dp.include_router(handlers.router)
+    dp["handlers"] = handlers
+    metrics.register_cache("registration", Database.registration_cache_stats)
+    metrics.register_cache("pages", handlers.page_cache.stats)
+    background = {}
+
+    # Одинаковый запуск и остановка для polling и webhook
+    async def on_startup():
+        with startup_profiler.phase("Database.init"):
+            await Database.init(DB_PATH, group_commit_ms=DB_GROUP_COMMIT_MS, read_pool_size=DB_READ_POOL_SIZE)
+        with startup_profiler.phase("Database.init_db"):
+            await Database.init_db()
+        if DB_CHECK_PLANS:
+            with startup_profiler.phase("Database.check_query_plans"):
+                await Database.check_query_plans()
+        # Кэш регистраций греется в фоне: до его готовности is_registered просто идет в БД
+        background["preload"] = asyncio.create_task(Database.preload_registered())
+        with startup_profiler.phase("фоновые задачи"):
+            await notifier.start()
+            if run_scheduler:
+                await scheduler.start()
+                if RETENTION_DAYS:
+                    await retention.start()
+            if prefetch_rates:
+                await handlers.rates_refresher.start()
+        background["metrics_log"] = asyncio.create_task(metrics.log_summary_loop(METRICS_LOG_INTERVAL))
+        if metrics_server and METRICS_PORT:
+            background["metrics_server"] = await metrics.start_server(WEBHOOK_HOST, METRICS_PORT)
+
+    async def on_shutdown():
+        background.pop("metrics_log").cancel()
+        background.pop("preload").cancel()
+        if "metrics_server" in background:
+            await background.pop("metrics_server").cleanup()
+        await scheduler.stop()
+        await retention.stop()
+        await notifier.stop()
+        await handlers.rates_refresher.stop()
+        await handlers.rates.close()
+        await Database.close()
+
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
 
 
 async def main():
     if not TOKEN:
         raise RuntimeError("TG_API_KEY не задан в .env")
     bot = Bot(token=TOKEN)
-    storage = MemoryStorage() # На всякий, dp его создает сам
-    dp = Dispatcher(storage=storage)
-    handlers = BotHandlers(url=URL)
-    dp.include_router(handlers.router)
-    await Database.init(DB_PATH)
-    await Database.init_db()
+    dp = create_dispatcher(bot, metrics_server=True)
     try:
         await dp.start_polling(bot)
     finally:
-        await Database.close()
         await bot.session.close()
 
 
+async def profile_startup():
+    # Тот же запуск, что у polling, но без getUpdates: отчет по фазам до готовности принимать обновления
+    bot = Bot(token=TOKEN or "0:profile")
+    with startup_profiler.phase("create_dispatcher"):
+        dp = create_dispatcher(bot, metrics_server=True)
+    await dp.emit_startup(bot=bot)
+    startup_profiler.mark("остальные startup-хуки")
+    print(startup_profiler.report())
+    await dp.emit_shutdown(bot=bot)
+    await bot.session.close()
+
+
+def run_webhook_worker(worker_index: int):
+    # Только для webhook-режима, polling эти модули не грузит
+    from aiohttp import web
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+    bot = Bot(token=TOKEN)
+    # Напоминания рассылает и курсы заранее обновляет только первый воркер, иначе каждое
+    # напоминание уйдет N раз, а запросов к API курсов станет в N раз больше.
+    # Лимит Telegram ~30 сообщений в секунду - на бота, поэтому делится между воркерами.
+    # Кэши процесса с несколькими воркерами отключены: апдейты одного чата приходят в разные процессы
+    notifier = Notifier(bot, global_rate=30 / WEBHOOK_WORKERS)
+    dp = create_dispatcher(bot, run_scheduler=worker_index == 0, notifier=notifier,
+                           page_cache_size=PAGE_CACHE_SIZE if WEBHOOK_WORKERS <= 1 else 0,
+                           fsm_cache=WEBHOOK_WORKERS <= 1, prefetch_rates=worker_index == 0)
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/metrics", metrics.handle_metrics)
+    setup_application(app, dp, bot=bot)
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT, reuse_port=WEBHOOK_WORKERS > 1, print=None)
+
+
+async def set_webhook():
+    bot = Bot(token=TOKEN)
+    try:
+        await bot.set_webhook(WEBHOOK_BASE + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET)
+    finally:
+        await bot.session.close()
+
+
+def main_webhook():
+    if not TOKEN:
+        raise RuntimeError("TG_API_KEY не задан в .env")
+    # Без секрета SimpleRequestHandler принимает любой POST на WEBHOOK_PATH
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET не задан в .env, webhook без него не запускается")
+    if WEBHOOK_BASE:
+        asyncio.run(set_webhook())
+    if WEBHOOK_WORKERS <= 1:
+        run_webhook_worker(0)
+        return
+    # Несколько процессов слушают один порт через SO_REUSEPORT
+    workers = [multiprocessing.Process(target=run_webhook_worker, args=(i,)) for i in range(WEBHOOK_WORKERS)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--webhook", action="store_true", help="принимать обновления через webhook вместо polling")
+    parser.add_argument("--profile-startup", action="store_true", help="вывести время запуска по фазам и выйти")
+    args = parser.parse_args()
+    if args.profile_startup:
+        asyncio.run(profile_startup())
+    elif args.webhook:
+        main_webhook()
+    else:
+        asyncio.run(main())
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+from functools import partial
+from typing import Optional
+from database import Database
+from notifier import Notifier
+from metrics import metrics
+
+
+class ReminderScheduler:
+    # Напоминания лежат в таблице reminders, очередью по времени служит индекс по due_at.
+    # Один цикл спит до ближайшего срока и отправляет все наступившие пачкой,
+    # поэтому память не зависит от числа ожидающих напоминаний и они переживают рестарт.
+    # Пачка сначала захватывается статусом 'sending', итоги пишутся по мере доставки;
+    # если stop() не дождался отправки, неотправленные возвращаются в pending.
+    # Доставка идет через очередь и пул воркеров Notifier: общие с остальными сообщениями
+    # лимиты Telegram и повтор по retry_after, так что сгусток на популярных интервалах
+    # растягивается во времени, а не упирается в flood-лимит.
+
+    def __init__(self, notifier: Notifier, batch_size: int = 100, drift_warning: float = 60,
+                 poll_interval: float = 1.0):
+        self.notifier = notifier
+        self.batch_size = batch_size
+        # Напоминания, созданные другими webhook-воркерами, не будят этот цикл через _wakeup,
+        # поэтому он не спит дольше poll_interval и перечитывает ближайший срок из БД
+        self.poll_interval = poll_interval
+        # Опоздание доставки относительно due_at, после которого пишем предупреждение
+        self.drift_warning = drift_warning
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._next_due = float("inf")
+        self._stopping = False
+        # reminder_id -> (reminder, future), future None - еще не передано в Notifier
+        self._inflight = {}
+        self._delivered_at = {}  # reminder_id -> время, когда Notifier завершил отправку
+        self._max_drift = 0.0
+
+    async def start(self):
+        self._stopping = False
+        # Захваченные до падения прошлого процесса: итог их отправки неизвестен, шлем снова
+        released = await Database.release_reminders()
+        if released:
+            logging.warning("Возвращено в очередь %d напоминаний, захваченных до рестарта", released)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10):
+        # Даем дослать текущую пачку; то, что не успело уйти за timeout, отменяется в Notifier
+        # и возвращается в pending, итоги уже отправленных сохраняются
+        if self._task:
+            self._stopping = True
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+            self._task = None
+        for _, future in self._inflight.values():
+            if future is not None:
+                future.cancel()
+        try:
+            await self._save(self._collect(release=True))
+        except Exception:
+            logging.exception("Не удалось сохранить итоги напоминаний при остановке")
+
+    async def schedule(self, chat_id: int, text: str, minutes: int) -> int:
+        due_at = time.time() + minutes * 60
+        reminder_id = await Database.add_reminder(chat_id, text, due_at)
+        if due_at < self._next_due:
+            # Новое напоминание раньше того, до которого спит цикл
+            self._wakeup.set()
+        return reminder_id
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                due = await Database.claim_due_reminders(time.time(), self.batch_size)
+                if due:
+                    await self._dispatch(due)
+                    continue
+                self._wakeup.clear()
+                next_due = await Database.next_reminder_due()
+                self._next_due = next_due if next_due is not None else float("inf")
+                timeout = self.poll_interval
+                if next_due is not None:
+                    timeout = min(timeout, max(0.0, next_due - time.time()))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Ошибка в планировщике напоминаний")
+                await asyncio.sleep(1)
+
+    def _collect(self, release: bool = False) -> list:
+        # Итоги завершенных отправок в виде (status, delivered_at, id) для save_reminder_results;
+        # release - вернуть в pending все незавершенные и отмененные
+        results = []
+        for reminder_id, (r, future) in list(self._inflight.items()):
+            if future is None or not future.done() or future.cancelled():
+                if release:
+                    del self._inflight[reminder_id]
+                    self._delivered_at.pop(reminder_id, None)
+                    results.append(("pending", None, reminder_id))
+                continue
+            del self._inflight[reminder_id]
+            delivered_at = self._delivered_at.pop(reminder_id, None) or time.time()
+            error = future.result()
+            if error is not None:
+                logging.warning("Не удалось отправить напоминание %s: %s", reminder_id, error)
+                results.append(("failed", delivered_at, reminder_id))
+                continue
+            drift = delivered_at - r["due_at"]
+            self._max_drift = max(self._max_drift, drift)
+            metrics.observe("bot_reminder_drift_seconds", "sent", drift)
+            results.append(("sent", delivered_at, reminder_id))
+        return results
+
+    def _mark_delivered(self, reminder_id: int, future: asyncio.Future):
+        if not future.cancelled():
+            self._delivered_at[reminder_id] = time.time()
+
+    async def _save(self, results: list):
+        await Database.save_reminder_results(results)
+        if self._max_drift > self.drift_warning:
+            logging.warning("Напоминания доставлены с опозданием до %.1f с", self._max_drift)
+        self._max_drift = 0.0
+
+    async def _dispatch(self, reminders):
+        # Следующую пачку берем только после итогов этой; итоги пишутся раз в poll_interval,
+        # чтобы после падения повторно ушло как можно меньше уже доставленного
+        for r in reminders:
+            self._inflight[r["id"]] = (r, None)
+        for r in reminders:
+            future = await self.notifier.submit(r["chat_id"], f"⏰ Напоминание: {r['text']}")
+            future.add_done_callback(partial(self._mark_delivered, r["id"]))
+            self._inflight[r["id"]] = (r, future)
+        waiting = {future for _, future in self._inflight.values() if future is not None}
+        while waiting:
+            _, waiting = await asyncio.wait(waiting, timeout=self.poll_interval)
+            await self._save(self._collect())
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Mapping, Optional
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from cache import TTLCache
+from database import Database
+
+
+class SQLiteStorage(BaseStorage):
+    # FSM-хранилище aiogram в таблице fsm_storage общей БД: диалоги переживают рестарт.
+    # Чтения кэшируются на cache_ttl секунд, записи копятся и пишутся одной пачкой
+    # раз в flush_interval. Неактивные дольше ttl диалоги удаляются.
+    # Кэш и отложенная запись локальны для процесса: с несколькими воркерами нужны
+    # cache_ttl=0 и flush_interval=0 (без кэша, запись сразу), тогда диалоги общие.
+
+    def __init__(self, ttl: float = 86400, cache_ttl: float = 2, flush_interval: float = 0.2,
+                 sweep_interval: float = 600, cache_size: int = 10000, key_builder: Optional[KeyBuilder] = None):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl) if cache_ttl else None
+        self._dirty = {}  # key -> (state, data), еще не записанные в БД
+        self._task: Optional[asyncio.Task] = None
+        self._closing = asyncio.Event()
+        # Первая запись после старта сразу чистит то, что истекло, пока бот не работал
+        self._last_sweep: Optional[float] = None
+
+    async def _load(self, key: str):
+        record = self._dirty.get(key) or (self._cache.get(key) if self._cache is not None else None)
+        if record is not None:
+            return record
+        row = await Database.get_fsm_record(key, time.time())
+        record = (row["state"], json.loads(row["data"]) if row["data"] else {}) if row else (None, {})
+        if self._cache is not None:
+            self._cache.set(key, record)
+        return record
+
+    async def _store(self, key: str, record):
+        if self._cache is not None:
+            self._cache.set(key, record)
+        self._dirty[key] = record
+        if not self.flush_interval:
+            await self.flush()
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        key = self.key_builder.build(key)
+        _, data = await self._load(key)
+        await self._store(key, (state.state if isinstance(state, State) else state, data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        key = self.key_builder.build(key)
+        state, _ = await self._load(key)
+        await self._store(key, (state, data.copy()))
+
+    async def get_data(self, key: StorageKey) -> dict:
+        _, data = await self._load(self.key_builder.build(key))
+        return data.copy()
+
+    async def flush(self):
+        dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        expires_at = time.time() + self.ttl
+        records = []
+        empty = []
+        for key, (state, data) in dirty.items():
+            if state is None and not data:
+                empty.append(key)
+            else:
+                records.append((key, state, json.dumps(data, ensure_ascii=False, separators=(",", ":")) if data else None,
+                                expires_at))
+        try:
+            await Database.save_fsm_records(records)
+            await Database.delete_fsm_records(empty)
+        except BaseException:
+            # Не теряем записи (в том числе при отмене): вернем их в очередь, если их еще не перезаписали
+            for key, record in dirty.items():
+                self._dirty.setdefault(key, record)
+            raise
+        # Чистка здесь, а не в _flush_loop: при flush_interval=0 цикла нет, запись идет прямо из _store
+        if self._last_sweep is None or time.monotonic() - self._last_sweep > self.sweep_interval:
+            self._last_sweep = time.monotonic()
+            await Database.delete_expired_fsm_records(time.time())
+
+    async def _flush_loop(self):
+        while self._dirty:
+            # close() будит цикл, чтобы тот дописал пачку и вышел сам, а не был отменен посреди flush
+            try:
+                await asyncio.wait_for(self._closing.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logging.exception("Не удалось записать FSM-состояния")
+            if self._closing.is_set():
+                return
+
+    async def close(self) -> None:
+        self._closing.set()
+        if self._task:
+            await self._task
+            self._task = None
+        await self.flush()
@@ -0,0 +1,60 @@
+# Офлайн-нагрузка на webhook: отправляет записанные обновления (JSON Lines, по одному Update в строке)
+# на локальный run.py --webhook и печатает пропускную способность и задержки ответа.
+# Пример: python webhook_replay.py updates.jsonl --url http://127.0.0.1:8080/webhook --secret $WEBHOOK_SECRET -c 50 -n 10
+import argparse
+import asyncio
+import json
+import time
+import aiohttp
+
+
+async def replay(updates, url: str, secret: str, concurrency: int, repeat: int):
+    queue = asyncio.Queue()
+    update_id = 0
+    for _ in range(repeat):
+        for update in updates:
+            update_id += 1
+            # Уникальный update_id, чтобы повторы не выглядели как дубли
+            queue.put_nowait({**update, "update_id": update_id})
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    latencies = []
+    statuses = {}
+
+    async def worker(session):
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as resp:
+                await resp.read()
+                statuses[resp.status] = statuses.get(resp.status, 0) + 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    total = len(latencies)
+    print(f"Отправлено: {total} за {elapsed:.2f} с ({total / elapsed:.0f} обновлений/с)")
+    if total:
+        print(f"p50: {latencies[total // 2] * 1000:.1f} мс, p99: {latencies[min(total - 1, int(total * 0.99))] * 1000:.1f} мс")
+    print(f"Коды ответов: {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", help="файл с обновлениями в формате JSON Lines")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("-c", "--concurrency", type=int, default=10)
+    parser.add_argument("-n", "--repeat", type=int, default=1, help="сколько раз прогнать файл")
+    args = parser.parse_args()
+    with open(args.file, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    asyncio.run(replay(updates, args.url, args.secret, args.concurrency, args.repeat))
+
+
+if __name__ == "__main__":
+    main()